@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from .models import Person, Invite
 from .models import TestStep, TestSummary
-from .models import Question, Answer, CurrentAnswers, ChallengeSummary
+from .models import Question, Answer, ChallengeSummary
 
 
 admin.site.register(Person)
@@ -11,5 +11,4 @@ admin.site.register(TestStep)
 admin.site.register(TestSummary)
 admin.site.register(Question)
 admin.site.register(Answer)
-admin.site.register(CurrentAnswers)
 admin.site.register(ChallengeSummary)
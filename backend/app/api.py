@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from django.http import JsonResponse
+
+import backend.core.visitor
+from backend.core.visitor import ChallengePage, TestScore, TestStepPage
+from .views import answer_drill, find_visitor, in_thread_pool
+
+
+# The JSON API serves the same visitor actions as the drill and test
+# pages, but returns only the data the page script needs to update
+# the page in place instead of the whole rendered page.
+
+def need_logged_in_api_visitor(handler):
+    def find_and_handle(request):
+        visitor = find_visitor(request)
+        if not visitor:
+            return JsonResponse({'error': "Login required"}, status=401)
+        return handler(request, visitor)
+
+    async def decorated(request):
+        return await in_thread_pool(find_and_handle)(request)
+    return decorated
+
+
+@need_logged_in_api_visitor
+def challenge_next(_, visitor: backend.core.visitor.Visitor):
+    # A challenge not answered yet is given again, so that reloading
+    # the page does not skip questions. An answered one, correctly too,
+    # has the next challenge prepared.
+    challenge = backend.core.visitor.get_current_challenge(visitor)
+    if challenge and not visitor.get_drill_state().next_question_id:
+        page = ChallengePage(challenge)
+    else:
+        page = visitor.get_next_challenge()
+    return JsonResponse(challenge_to_json(page))
+
+
+@need_logged_in_api_visitor
+def challenge_prepared(_, visitor: backend.core.visitor.Visitor):
+    # Changes nothing, so that the page may request the challenge
+    # "Next" shows while the answers are read.
+    challenge = backend.core.visitor.get_prepared_challenge(visitor)
+    if not challenge:
+        return JsonResponse({'error': "No challenge prepared"}, status=404)
+    return JsonResponse(challenge_to_json(ChallengePage(challenge)))
+
+
+@need_logged_in_api_visitor
+def challenge_answer(request, visitor: backend.core.visitor.Visitor):
+    answer_choice = request.GET.get('choice')
+    if not answer_choice:
+        return JsonResponse({'error': "No answer choice"}, status=400)
+    try:
+        page = answer_drill(visitor, answer_choice)
+    except (AssertionError, ValueError) as ex:
+        return JsonResponse({'error': str(ex)}, status=400)
+    return JsonResponse(challenge_to_json(page))
+
+
+@need_logged_in_api_visitor
+def test_step(request, visitor: backend.core.visitor.Visitor):
+    test_answer = request.GET.get('test_answer')
+    if not test_answer:
+        result = visitor.show_test_step()
+    else:
+        result = visitor.submit_test_answer(test_answer)
+    return JsonResponse(test_result_to_json(result))
+
+
+def challenge_to_json(page: ChallengePage) -> dict:
+    challenge = page.challenge
+    disclose_answers = challenge.disclose_answers
+    answers = []
+    for answer in challenge.answers:
+        answer_json = {'id': answer.pk, 'text': answer.answer_text}
+        # correctness is only sent once the answers are disclosed
+        if disclose_answers:
+            answer_json['is_correct'] = answer.is_correct
+        answers.append(answer_json)
+
+    return {
+        'question_id': challenge.question.pk,
+        'question': challenge.question.question_text,
+        'explanation': (challenge.question.explanation_text
+            if disclose_answers else None),
+        'answers': answers,
+        'disclose_answers': disclose_answers,
+        'is_failure': page.is_failure,
+        'error': page.with_error,
+    }
+
+
+def test_result_to_json(result: TestStepPage | TestScore) -> dict:
+    if isinstance(result, TestScore):
+        return {
+            'start_score': result.start_score,
+            'final_score': result.final_score,
+        }
+    return {
+        'test_question': result.test_step.test_question.test_question,
+        'countdown': result.countdown,
+    }
@@ -2,4 +2,13 @@ from django.apps import AppConfig
 
 
 class AppConfig(AppConfig):
-    name = 'app'
+    name = 'backend.app'
+    label = 'app'
+
+    def ready(self):
+        import backend.core.catalog
+        backend.core.catalog.connect_signals()
+        import backend.core.sqlite
+        backend.core.sqlite.connect_signals()
+        # checks are registered on import
+        import backend.app.checks
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_debug_is_off(app_configs, **kwargs):
+    if not settings.DEBUG:
+        return []
+    return [Warning(
+        "DEBUG is on: templates are compiled on every request "
+        "and error pages show settings and code.",
+        hint="Set PRODUCTION=1 in the environment of the deployed app.",
+        id='app.W001',
+    )]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+from collections import OrderedDict
+import threading
+from typing import Callable, Hashable
+
+from django.conf import settings
+from django.utils.html import escape, format_html_join
+from django.utils.safestring import SafeString
+
+from backend.core.catalog import get_catalog
+from .models import Question, Answer, TestStep
+
+
+class FragmentCache:
+    """Rendered markup of drill content, the least recently used dropped"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fragments: OrderedDict[Hashable, SafeString] = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key: Hashable,
+            render: Callable[[], SafeString]) -> SafeString:
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        # rendered outside the lock, a parallel miss renders the same
+        fragment = render()
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+fragment_cache = FragmentCache(settings.FRAGMENT_CACHE_SIZE)
+
+
+# Content does not change within a catalog version, so fragments are
+# keyed by it and the ones of a previous version are evicted in time.
+
+def question_html(question: Question) -> SafeString:
+    return fragment_cache.get(
+        ('question', question.pk, get_catalog().stamp),
+        lambda: render_lines(question.question_text))
+
+
+def explanation_html(question: Question) -> SafeString:
+    return fragment_cache.get(
+        ('explanation', question.pk, get_catalog().stamp),
+        lambda: render_lines(question.explanation_text))
+
+
+def answer_html(answer: Answer) -> SafeString:
+    return fragment_cache.get(
+        ('answer', answer.pk, get_catalog().stamp),
+        lambda: escape(answer.answer_text))
+
+
+def test_question_html(test_step: TestStep) -> SafeString:
+    return fragment_cache.get(
+        ('test_question', test_step.pk, get_catalog().stamp),
+        lambda: render_lines(test_step.test_question))
+
+
+def render_lines(text: str) -> SafeString:
+    return format_html_join(
+        "\n", "<p>{}</p>", ((line,) for line in text.split("\n")))
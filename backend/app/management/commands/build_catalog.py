@@ -0,0 +1,32 @@
+from pathlib import Path
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backend.core.catalog import Catalog, bump_stamp, read_stamp
+from backend.core.snapshot import write_snapshot
+
+class Command(BaseCommand):
+    help = "Writes questions, answers and test steps into a catalog file " \
+        "which workers map into memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.CATALOG_SNAPSHOT,
+            help="Path of the catalog file, CATALOG_SNAPSHOT by default")
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError("No path given for the catalog file")
+        started = time.perf_counter()
+
+        # the file is used only while its stamp matches the one in DB
+        if not read_stamp():
+            bump_stamp()
+        catalog = Catalog.load(read_stamp())
+        path = Path(options['output'])
+        write_snapshot(catalog, path)
+
+        seconds = time.perf_counter() - started
+        print(f"{len(catalog.questions)} questions, "
+            f"{len(catalog.answers)} answers written to {path} "
+            f"({path.stat().st_size} bytes) in {seconds:.2f}s")
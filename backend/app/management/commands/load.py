@@ -1,50 +1,50 @@
 from importlib.resources import files
-import json
 
 from django.core import management
-from django.core.management.base import BaseCommand
-from backend.app.models import Answer, Question, TestStep
+from django.core.management.base import BaseCommand, CommandError
+from backend.core.catalog import content_reload
+from backend.core.content import LoadStats, load_fixture, sync_fixtures
+from backend.core.validation import validate_fixtures
 
 class Command(BaseCommand):
     help = "Clears database and loads new data into it"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true',
+            help="Apply only changes of the fixtures to the content in DB, "
+                "keeping users and their progress")
+        parser.add_argument('--check', action='store_true',
+            help="Only validate the fixtures, do not touch the database")
+
     def handle(self, *args, **options):
+        files_to_load = sorted(files('backend.app.fixtures').glob('*.json'))
+
+        # all files are checked in parallel before anything is written
+        errors = validate_fixtures(files_to_load)
+        if errors:
+            raise CommandError(
+                f"{len(errors)} fixture errors:\n" + "\n".join(errors))
+        print(f"{len(files_to_load)} fixture files are valid")
+        if options['check']:
+            return
+
+        with content_reload():
+            if options['sync']:
+                print(sync_fixtures(files_to_load))
+            else:
+                self.load_fixtures(files_to_load)
+        print('The database was seeded successfully!')
+
+    def load_fixtures(self, files_to_load):
         management.call_command('flush', verbosity=0, interactive=True)
         #management.call_command('loaddata', 'simpledrill_db.json', verbosity=0)
 
-        files_to_load = files('backend.app.fixtures').glob('*.json')
-
+        total = LoadStats("total")
         for file in files_to_load:
-            if "test" in str(file):
-                file = file.read_text()
-                data = json.loads(file)
-                for test_step in data:
-                    TestStep(
-                        test_question=test_step['q'],
-                        topic=test_step['topic'],
-                        test_answer=test_step['+'],).save()
-
-            if "challenges" in str(file):
-                file = file.read_text()
-                data = json.loads(file)
-                for challenge in data:
-                    question = Question(
-                        question_text=challenge['q'],
-                        explanation_text=challenge['th'],
-                        topic=challenge['topic'])
-                    question.save()
-
-                    # there can be no correct answer not to prompt the user
-                    if '+' in challenge:
-                        for answer in challenge['+']:
-                            Answer(
-                                question=question,
-                                answer_text=answer,
-                                is_correct=True).save()
-
-                    for answer in challenge['-']:
-                        Answer(
-                            question=question,
-                            answer_text=answer,
-                            is_correct=False).save()
-        print('The database was seeded successfully!')
+            stats = load_fixture(file)
+            print(stats)
+            total.questions += stats.questions
+            total.answers += stats.answers
+            total.test_steps += stats.test_steps
+            total.seconds += stats.seconds
+        print(total)
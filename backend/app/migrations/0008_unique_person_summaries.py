@@ -0,0 +1,49 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:05
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def merge_duplicate_summaries(apps, schema_editor):
+    # Double clicks could write a summary row twice. Keep the first row,
+    # adding asked counts of its duplicates to it.
+    ChallengeSummary = apps.get_model('app', 'ChallengeSummary')
+    kept_challenges = {}
+    for record in ChallengeSummary.objects.order_by('pk'):
+        key = (record.person_id, record.question_id)
+        if key not in kept_challenges:
+            kept_challenges[key] = record
+            continue
+        kept_challenges[key].asked_count += record.asked_count
+        kept_challenges[key].save()
+        record.delete()
+
+    # Keep the answered test step if there is one.
+    TestSummary = apps.get_model('app', 'TestSummary')
+    kept_test_steps = set()
+    for record in TestSummary.objects.order_by(
+            F('is_correct').desc(nulls_last=True), 'pk'):
+        key = (record.person_id, record.test_question_id)
+        if key in kept_test_steps:
+            record.delete()
+        kept_test_steps.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_catalogversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='challengesummary',
+            constraint=models.UniqueConstraint(fields=('person', 'question'), name='unique_person_question'),
+        ),
+        migrations.AddConstraint(
+            model_name='testsummary',
+            constraint=models.UniqueConstraint(fields=('person', 'test_question'), name='unique_person_test_question'),
+        ),
+    ]
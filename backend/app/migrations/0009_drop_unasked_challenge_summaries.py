@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def drop_unasked_challenge_summaries(apps, schema_editor):
+    # Rows are written only for asked questions now, a missing row
+    # stands for a question asked zero times.
+    ChallengeSummary = apps.get_model('app', 'ChallengeSummary')
+    ChallengeSummary.objects.filter(asked_count=0).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_unique_person_summaries'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            drop_unasked_challenge_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:07
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_question_topics(apps, schema_editor):
+    ChallengeSummary = apps.get_model('app', 'ChallengeSummary')
+    Question = apps.get_model('app', 'Question')
+    ChallengeSummary.objects.update(topic=Subquery(
+        Question.objects.filter(pk=OuterRef('question_id')).values('topic')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_drop_unasked_challenge_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengesummary',
+            name='topic',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(
+            copy_question_topics, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='challengesummary',
+            index=models.Index(fields=['person', 'topic', 'asked_count'], name='person_topic_asked_count'),
+        ),
+    ]
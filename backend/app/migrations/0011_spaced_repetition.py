@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_challenge_summary_topic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challengesummary',
+            name='due',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='challengesummary',
+            name='ease',
+            field=models.FloatField(default=2.5),
+        ),
+        migrations.AddField(
+            model_name='challengesummary',
+            name='interval',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='challengesummary',
+            name='repetitions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='challengesummary',
+            index=models.Index(fields=['person', 'topic', 'due'], name='person_topic_due'),
+        ),
+    ]
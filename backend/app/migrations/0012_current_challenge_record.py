@@ -0,0 +1,43 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_current_answers(apps, schema_editor):
+    CurrentAnswers = apps.get_model('app', 'CurrentAnswers')
+    Person = apps.get_model('app', 'Person')
+    saved_answers = {}
+    for saved_answer in CurrentAnswers.objects.select_related(
+            'answer').order_by('pk'):
+        saved_answers.setdefault(saved_answer.person_id, []).append(
+            saved_answer.answer)
+    for person_id, answers in saved_answers.items():
+        Person.objects.filter(pk=person_id).update(
+            current_question_id=answers[0].question_id,
+            current_answers=",".join(str(answer.pk) for answer in answers))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_spaced_repetition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='current_answers',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='current_question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.question'),
+        ),
+        migrations.RunPython(
+            copy_current_answers, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='CurrentAnswers',
+        ),
+    ]
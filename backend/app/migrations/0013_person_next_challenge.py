@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_current_challenge_record'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='next_answers',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='next_question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.question'),
+        ),
+    ]
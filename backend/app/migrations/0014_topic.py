@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+def create_topics(apps, schema_editor):
+    # Topics of existing rows, referred to by name from 0015 on
+    Topic = apps.get_model('app', 'Topic')
+    names = set()
+    for model_name in ('Question', 'TestStep',
+            'TestSummary', 'ChallengeSummary'):
+        model = apps.get_model('app', model_name)
+        names.update(model.objects.values_list('topic', flat=True)
+            .order_by().distinct())
+    Topic.objects.bulk_create(
+        [Topic(name=name) for name in sorted(names)],
+        ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_person_next_challenge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Topic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField(unique=True)),
+            ],
+        ),
+        migrations.RunPython(create_topics, migrations.RunPython.noop),
+    ]
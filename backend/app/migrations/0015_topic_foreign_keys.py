@@ -0,0 +1,42 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_topic'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testsummary',
+            index=models.Index(fields=['person', 'topic', 'is_correct'], name='person_topic_is_correct'),
+        ),
+        migrations.AddIndex(
+            model_name='testsummary',
+            index=models.Index(fields=['person', 'is_correct'], name='person_is_correct'),
+        ),
+        migrations.AlterField(
+            model_name='challengesummary',
+            name='topic',
+            field=models.ForeignKey(db_column='topic', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.topic', to_field='name'),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='topic',
+            field=models.ForeignKey(db_column='topic', on_delete=django.db.models.deletion.CASCADE, to='app.topic', to_field='name'),
+        ),
+        migrations.AlterField(
+            model_name='teststep',
+            name='topic',
+            field=models.ForeignKey(db_column='topic', on_delete=django.db.models.deletion.CASCADE, to='app.topic', to_field='name'),
+        ),
+        migrations.AlterField(
+            model_name='testsummary',
+            name='topic',
+            field=models.ForeignKey(db_column='topic', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.topic', to_field='name'),
+        ),
+    ]
@@ -5,10 +5,22 @@ from django.utils import timezone
 
 class Person(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Fields below are the checkpoint of the drill state kept in the
+    # cache, see backend.core.drill_state.
     # If user answered challenge wrongly or issued the "I don't know"
     # command, disclose answers until the "next challenge" command.
     disclose_answers = models.BooleanField(null=True)
     challenge_topic = models.TextField(null=True)
+    # The last challenge shown to user to retrieve it if user makes
+    # a pause: the question and comma separated ids of answers on screen.
+    current_question = models.ForeignKey('Question', null=True,
+        on_delete=models.SET_NULL, related_name='+')
+    current_answers = models.TextField(default="")
+    # The challenge chosen to be shown next, prepared when the current
+    # one is answered so that the "next challenge" command only reads it.
+    next_question = models.ForeignKey('Question', null=True,
+        on_delete=models.SET_NULL, related_name='+')
+    next_answers = models.TextField(default="")
 
     def __str__(self):
         return f"{self.user.username} admin {self.user.is_staff}"
@@ -27,25 +39,52 @@ class Invite(models.Model):
         return f"\"{self.comment}\" used by {self.used_by}"
 
 
+class Topic(models.Model):
+    name = models.TextField(unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+# Rows refer to topics by name, so that "topic_id" gives the topic name
+# and filters by topic need no join.
+
 class TestStep(models.Model):
-    topic = models.TextField(default="")
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE,
+        to_field='name', db_column='topic')
     test_question = models.TextField()
     test_answer = models.TextField(default="")
 
     def __str__(self):
-        return f"{self.topic}, \"{self.test_question[:40]}\", \
+        return f"{self.topic_id}, \"{self.test_question[:40]}\", \
             {self.test_answer}"
 
 
 class TestSummary(models.Model):
     person = models.ForeignKey(Person, on_delete=models.CASCADE)
     test_question = models.ForeignKey(TestStep, on_delete=models.CASCADE)
-    topic = models.TextField(default="")
+    # indexed together with person below
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE,
+        to_field='name', db_column='topic', db_index=False)
     user_answer = models.CharField(max_length=50)
     is_correct = models.BooleanField(null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['person', 'test_question'],
+                name='unique_person_test_question'),
+        ]
+        indexes = [
+            # test progress: answers of a person counted by topic
+            models.Index(fields=['person', 'topic', 'is_correct'],
+                name='person_topic_is_correct'),
+            # the test step a person is to answer
+            models.Index(fields=['person', 'is_correct'],
+                name='person_is_correct'),
+        ]
+
     def __str__(self):
-        return f"{self.person.user.username}, {self.topic}, \
+        return f"{self.person.user.username}, {self.topic_id}, \
             \"{self.test_question.test_question[:40]}\", \
             {self.test_question.test_answer} VS {self.user_answer}, \
             {self.is_correct}"
@@ -54,10 +93,11 @@ class TestSummary(models.Model):
 class Question(models.Model):
     question_text = models.TextField()
     explanation_text = models.TextField(default="")
-    topic = models.TextField(default="")
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE,
+        to_field='name', db_column='topic')
 
     def __str__(self):
-        return f"\"{self.question_text[:40]}\" TOPIC {self.topic}"
+        return f"\"{self.question_text[:40]}\" TOPIC {self.topic_id}"
 
 
 class Answer(models.Model):
@@ -70,19 +110,40 @@ class Answer(models.Model):
             question \"{self.question.question_text[:40]}\""
 
 
-class CurrentAnswers(models.Model):
-    person = models.ForeignKey(Person, on_delete=models.CASCADE)
-    answer = models.ForeignKey(Answer, on_delete=models.CASCADE)
-
-    def __str__(self):
-        return f"{self.answer.answer_text[:40]}, {self.answer.is_correct}"
-
-
 class ChallengeSummary(models.Model):
     person = models.ForeignKey(Person, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    # Copy of question topic to pick least asked question with an index
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE,
+        to_field='name', db_column='topic', db_index=False)
     asked_count = models.IntegerField(default=0)
+    # Spaced repetition state, see backend.core.scheduler
+    ease = models.FloatField(default=2.5)
+    repetitions = models.IntegerField(default=0)
+    interval = models.FloatField(default=0)  # days
+    due = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['person', 'question'],
+                name='unique_person_question'),
+        ]
+        indexes = [
+            models.Index(fields=['person', 'topic', 'asked_count'],
+                name='person_topic_asked_count'),
+            models.Index(fields=['person', 'topic', 'due'],
+                name='person_topic_due'),
+        ]
 
     def __str__(self):
         return f"{self.person.user.username}, \
             \"{self.question.question_text[:40]}\""
+
+
+class CatalogVersion(models.Model):
+    # Replaced on every change of questions, answers or test steps
+    # so that each worker knows its cached content is outdated.
+    stamp = models.TextField(default="")
+
+    def __str__(self):
+        return f"catalog {self.stamp}"
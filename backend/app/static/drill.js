@@ -0,0 +1,162 @@
+// Drill page renderer: answers and "Next" clicks are sent to the JSON API
+// and the page is updated in place instead of being loaded again.
+// Without this script the links of the server-rendered page still work.
+
+const ANSWER_LETTERS = ["a", "d", "s", "f"];
+// server-rendered drill page, links fall back to it
+let drillUrl = "";
+
+function escapeHtml(text) {
+    const element = document.createElement("span");
+    element.textContent = text;
+    return element.innerHTML;
+}
+
+function renderLines(text) {
+    return text.split("\n")
+        .map(line => `<p>${escapeHtml(line)}</p>`).join("");
+}
+
+function renderAnswer(answer, index, challenge) {
+    const letter = ANSWER_LETTERS[index];
+    let fill = "grey";
+    let link = `<a id="answer_${letter}"
+        href="${drillUrl}?choice=${answer.id}" data-choice="${answer.id}"></a>`;
+    if (challenge.disclose_answers) {
+        fill = answer.is_correct ? "hue(114)" : "hue(12)";
+        link = "";
+    }
+    return `
+        <nu-cardbtn height="20" width="20" place="flex-start"
+                fill="${fill}" overflow="auto">
+            ${link}
+            <nu-heading level="5" color="white">
+                Answer ${letter.toUpperCase()}</nu-heading>
+            <nu-line></nu-line>
+            <nu-block size="md">${escapeHtml(answer.text)}</nu-block>
+        </nu-cardbtn>`;
+}
+
+function renderActionButton(text, width, choice, disclose_answers) {
+    const link = disclose_answers ?
+        "" : `<a href="${drillUrl}?choice=${choice}"
+            data-choice="${choice}"></a>`;
+    return `
+        <nu-btn height="4" width="${width}" place="center" fill="#ffd43b"
+                size="lg" color="dark grey">${link}${text}</nu-btn>`;
+}
+
+function renderChallenge(challenge, selectTopicUrl) {
+    const disclose = challenge.disclose_answers;
+    const explanation = disclose ? `
+        ❗️ EXPLANATION: ${renderLines(challenge.explanation)}` : "";
+    const error = challenge.error ? `
+        <nu-card height="10" width="21" place="center" fill="hue(12)">
+            ${escapeHtml(challenge.error)}
+        </nu-card>` : "";
+    const result = challenge.is_failure ?
+        "Your answer is not correct" : "Your answer is correct";
+    const next = disclose ? `
+        <nu-cardbtn height="8" fill="#306998" color="white">
+            <a id="next" href="${drillUrl}?next=next" data-next="next"></a>
+            <nu-heading level="5" text="center">${result}</nu-heading>
+            <nu-line></nu-line>
+            <nu-block text="center" size="md">Next 👉</nu-block>
+        </nu-cardbtn>` : "";
+    const answers = challenge.answers.map(
+        (answer, index) => renderAnswer(answer, index, challenge));
+
+    return `
+    <nu-flex flow="column" content="center">
+    <nu-flex content="center" height="40">
+    <nu-flex flow="column" height="40" width="21">
+        <nu-card height="36" width="21" place="flex-start" fill="grey"
+                color="white" overflow="auto">
+            ❓ QUESTION: ${renderLines(challenge.question)}
+            ${explanation}
+        </nu-card>
+        ${error}
+        ${next}
+        <nu-flex height="4" width="21">
+            ${renderActionButton("Help", 5, "dont_know", disclose)}
+            ${renderActionButton(
+                "No correct answer", 11, "no_correct_answer", disclose)}
+            <nu-btn height="4" width="5" place="center" fill="#ffd43b"
+                    size="lg" color="dark grey">
+                <a href="${selectTopicUrl}"></a>End</nu-btn>
+        </nu-flex>
+    </nu-flex>
+    <nu-flex flow="column" height="40" width="20">
+        ${answers.slice(0, 2).join("")}
+    </nu-flex>
+    <nu-flex flow="column" height="40" width="20">
+        ${answers.slice(2, 4).join("")}
+    </nu-flex>
+    </nu-flex>
+    </nu-flex>`;
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const drill = document.getElementById("drill");
+    const urls = drill.dataset;
+    drillUrl = urls.drillUrl;
+
+    // The challenge "Next" shows, read while the disclosed answers are
+    // read. The server only moves to it when "Next" is clicked.
+    let prepared = null;
+    // the move to the next challenge, answers are sent after it
+    let moving = Promise.resolve();
+
+    function fetchChallenge(url) {
+        return fetch(url, {credentials: "same-origin"})
+            .then(response => response.ok ? response.json() : null)
+            .catch(() => null);
+    }
+
+    function render(challenge) {
+        drill.innerHTML = renderChallenge(challenge, urls.selectTopicUrl);
+        prepared = challenge.disclose_answers ?
+            fetchChallenge(urls.preparedUrl) : null;
+    }
+
+    async function update(request) {
+        const challenge = await request;
+        if (!challenge) {
+            // let the server-rendered page tell what went wrong
+            window.location.reload();
+            return;
+        }
+        render(challenge);
+    }
+
+    async function showNext(preparedRequest) {
+        const request = fetchChallenge(urls.nextUrl);
+        moving = request;
+        const challenge = preparedRequest ? await preparedRequest : null;
+        if (challenge) {
+            render(challenge);
+        }
+        const shown = await request;
+        // the prepared one unless content was reloaded meanwhile
+        if (!challenge
+                || JSON.stringify(shown) !== JSON.stringify(challenge)) {
+            update(shown);
+        }
+    }
+
+    drill.addEventListener("click", e => {
+        const link = e.target.closest("a[data-choice], a[data-next]");
+        if (!link) {
+            return;
+        }
+        e.preventDefault();
+        if (link.dataset.next) {
+            showNext(prepared);
+            prepared = null;
+        } else {
+            const choice = encodeURIComponent(link.dataset.choice);
+            update(moving.then(() =>
+                fetchChallenge(`${urls.answerUrl}?choice=${choice}`)));
+        }
+    });
+});
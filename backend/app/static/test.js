@@ -0,0 +1,45 @@
+// Test page renderer: answers are sent to the JSON API and the next
+// question is shown in place. Scores are shown by the server-rendered
+// page, which is loaded once the test is over.
+
+function renderTestQuestion(step) {
+    const lines = step.test_question.split("\n").map(line => {
+        const element = document.createElement("p");
+        element.textContent = line;
+        return element.outerHTML;
+    });
+    return `❓ QUESTION ${step.countdown}: ${lines.join("")}`;
+}
+
+async function submitTestAnswer(url, testAnswer) {
+    const query = `test_answer=${encodeURIComponent(testAnswer)}`;
+    const response = await fetch(
+        `${url}?${query}`, {credentials: "same-origin"});
+    const step = response.ok ? await response.json() : {};
+    if (!step.test_question) {
+        window.location.reload();
+        return;
+    }
+    document.getElementById("test_question").innerHTML =
+        renderTestQuestion(step);
+    const input = document.querySelector("#test_answer input");
+    if (input) {
+        input.value = "";
+    }
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const form = document.getElementById("submit_my_test_answer");
+    const url = form.dataset.stepUrl;
+    form.addEventListener("input", e => {
+        e.stopImmediatePropagation();
+        submitTestAnswer(url, e.detail.test_answer || "");
+    }, true);
+    const noAnswer = document.getElementById("no_answer");
+    if (noAnswer) {
+        noAnswer.addEventListener("click", e => {
+            e.preventDefault();
+            submitTestAnswer(url, "no_answer");
+        });
+    }
+});
@@ -1,10 +1,41 @@
-from django.test import TestCase
+import asyncio
+import dataclasses
+from importlib.resources import files
+import io
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.test import override_settings
+from django.test import skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.contrib.auth import get_user_model
 
 from .models import Person, Invite, TestStep, Question, Answer
-from .models import TestSummary
+from .models import TestSummary, ChallengeSummary, Topic
 import backend.core
 import backend.core.visitor
+import backend.core.catalog
+import backend.core.scheduler
+import backend.core.sampling
+import backend.core.content
+import backend.core.validation
+import backend.core.snapshot
+import backend.core.sqlite
+import backend.core.asked_counts
+import backend.core.drill_state
+import backend.app.fragments
+import backend.app.views
+import backend.app.checks
 
 
 SAMPLE_TESTQUESTION_TEXT = "How many characters are there in ASCII?"
@@ -12,6 +43,9 @@ SAMPLE_QUESTION_TEXT = "What is a callable?"
 SAMPLE_EXPLANATION_TEXT = "Function"
 SAMPLE_TOPIC_TEXT = "git"
 
+# Set by CI where the tests of row locks must run rather than be skipped
+REQUIRE_ROW_LOCKS = os.environ.get('REQUIRE_ROW_LOCKS') == '1'
+
 
 def create_person():
     User = get_user_model()
@@ -22,17 +56,21 @@ def create_person():
     person.user = user
     user.save()
     person.save()
+    # drill state left by a person with the same id in another test
+    cache.clear()
     return person
 
 
 def save_test_questions_to_db():
+    Topic.objects.get_or_create(name="start")
+    Topic.objects.get_or_create(name="final")
     for _ in range(5):
         TestStep(
-            topic="start",
+            topic_id="start",
             test_question=SAMPLE_TESTQUESTION_TEXT,
             test_answer="128").save()
         TestStep(
-            topic="final",
+            topic_id="final",
             test_question=SAMPLE_TESTQUESTION_TEXT,
             test_answer="128").save()
 
@@ -42,7 +80,7 @@ def do_start_test_for_user(visitor, answer_bool):
     for test_step in test_steps_to_show:
         TestSummary(
             user=visitor.user,
-            topic="start",
+            topic_id="start",
             test_question=test_step,
             is_correct=answer_bool).save()
 
@@ -52,23 +90,52 @@ def do_final_test_for_user(visitor, answer_bool):
     for test_step in test_steps_to_show:
         TestSummary(
             user=visitor.user,
-            topic="final",
+            topic_id="final",
             test_question=test_step,
             is_correct=answer_bool).save()
 
 
 def save_questions_and_answers_to_db():
+    Topic.objects.get_or_create(name=SAMPLE_TOPIC_TEXT)
     for _ in range(5):
         Question(
             question_text=SAMPLE_QUESTION_TEXT,
             explanation_text=SAMPLE_EXPLANATION_TEXT,
-            topic=SAMPLE_TOPIC_TEXT).save()
+            topic_id=SAMPLE_TOPIC_TEXT).save()
     all_questions = Question.objects.all()
     for question in all_questions:
         for _ in range(4):
-            Answer(question=question, answer_text="No", correct=False).save()
+            Answer(question=question, answer_text="No", is_correct=False).save()
         for _ in range(1):
-            Answer(question=question, answer_text="Yes", correct=True).save()
+            Answer(question=question, answer_text="Yes", is_correct=True).save()
+
+
+class CaptureThreadQueries:
+    """Collects SQL run by connections opened in any thread meanwhile."""
+
+    def __enter__(self):
+        self.sqls = []
+        self.wrapped = []
+        connection_created.connect(self.watch)
+        return self
+
+
+    def __exit__(self, *_):
+        connection_created.disconnect(self.watch)
+        for wrapped in self.wrapped:
+            if self.record in wrapped.execute_wrappers:
+                wrapped.execute_wrappers.remove(self.record)
+
+
+    def watch(self, sender, connection, **kwargs):
+        if self.record not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.record)
+            self.wrapped.append(connection)
+
+
+    def record(self, execute, sql, params, many, context):
+        self.sqls.append(sql)
+        return execute(sql, params, many, context)
 
 
 class PersonModelTests(TestCase):
@@ -135,14 +202,776 @@ class UserTestModelTests(TestCase):
         self.assertEqual(start_question_count, user_start_question_count)
 
 
+    @override_settings(CATALOG_CHECK_SECONDS=60)
+    def test_test_progress_is_counted_once_per_visitor(self):
+        person = create_person()
+        save_test_questions_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.set_test_steps(topic="start")
+        TestSummary.objects.filter(person=person).update(is_correct=True)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(visitor.visitor_did_start_test())
+            self.assertFalse(visitor.visitor_did_final_test())
+            self.assertEqual(visitor.count_test_score(), ("5 of 5", None))
+
+
+    def test_test_step_is_shown_with_topic_name(self):
+        save_test_questions_to_db()
+        test_step = TestStep.objects.filter(topic="start").first()
+        self.assertTrue(str(test_step).startswith(
+            f"start, \"{SAMPLE_TESTQUESTION_TEXT}\", "))
+
+
 class ChallengeModelTests(TestCase):
     def test_save_question_to_db(self):
+        Topic.objects.create(name=SAMPLE_TOPIC_TEXT)
         Question(
             question_text=SAMPLE_QUESTION_TEXT,
             explanation_text=SAMPLE_EXPLANATION_TEXT,
-            topic=SAMPLE_TOPIC_TEXT).save()
+            topic_id=SAMPLE_TOPIC_TEXT).save()
         question = Question.objects.get(question_text=SAMPLE_QUESTION_TEXT)
         self.assertIsNotNone(question)
         self.assertTrue(question.question_text == SAMPLE_QUESTION_TEXT)
         self.assertTrue(question.explanation_text == SAMPLE_EXPLANATION_TEXT)
-        self.assertTrue(question.topic == SAMPLE_TOPIC_TEXT)
+        self.assertTrue(question.topic.name == SAMPLE_TOPIC_TEXT)
+
+
+    @override_settings(CATALOG_CHECK_SECONDS=60)
+    def test_catalog_is_reloaded_after_content_change(self):
+        save_questions_and_answers_to_db()
+        catalog = backend.core.catalog.get_catalog()
+        question_ids = catalog.get_topic_question_ids(SAMPLE_TOPIC_TEXT)
+        self.assertEqual(len(question_ids), 5)
+        with self.assertNumQueries(0):
+            answers = backend.core.catalog.get_catalog().get_answers(
+                question_ids[0])
+            self.assertEqual(len(answers), 5)
+            self.assertEqual(answers[0].question.pk, question_ids[0])
+
+        question = Question.objects.get(pk=question_ids[0])
+        question.topic = Topic.objects.create(name="python")
+        question.save()
+        catalog = backend.core.catalog.get_catalog()
+        self.assertEqual(catalog.get_topic_question_ids("python"),
+            (question.pk,))
+
+
+    def test_catalog_skips_answers_of_questions_added_while_loading(self):
+        save_questions_and_answers_to_db()
+        last_question = Question.objects.last()
+        questions_read_before = Question.objects.exclude(pk=last_question.pk)
+
+        with mock.patch.object(Question.objects, "order_by",
+                return_value=questions_read_before):
+            catalog = backend.core.catalog.Catalog.load("stamp")
+        self.assertIsNone(catalog.get_question(last_question.pk))
+        self.assertEqual(len(catalog.answers), 4 * 5)
+
+
+    def test_catalog_snapshot_matches_catalog(self):
+        save_questions_and_answers_to_db()
+        save_test_questions_to_db()
+        catalog = backend.core.catalog.get_catalog()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "catalog.bin"
+            backend.core.snapshot.write_snapshot(catalog, path)
+            snapshot = backend.core.snapshot.SnapshotCatalog.open(path)
+
+        self.assertEqual(snapshot.stamp, catalog.stamp)
+        self.assertEqual(snapshot.count_test_steps(),
+            {"start": 5, "final": 5})
+        self.assertEqual(snapshot.get_test_step_ids("final"),
+            catalog.get_test_step_ids("final"))
+        question_ids = snapshot.get_topic_question_ids(SAMPLE_TOPIC_TEXT)
+        self.assertEqual(question_ids,
+            catalog.get_topic_question_ids(SAMPLE_TOPIC_TEXT))
+        for question_id in question_ids:
+            question = snapshot.get_question(question_id)
+            self.assertEqual(
+                (question.question_text, question.explanation_text),
+                (SAMPLE_QUESTION_TEXT, SAMPLE_EXPLANATION_TEXT))
+            self.assertEqual(snapshot.get_answer_ids(question_id),
+                catalog.get_answer_ids(question_id))
+            for answer in snapshot.get_answers(question_id):
+                self.assertEqual(answer.question.pk, question_id)
+                self.assertEqual(
+                    (answer.answer_text, answer.is_correct),
+                    (catalog.get_answer(answer.pk).answer_text,
+                        catalog.get_answer(answer.pk).is_correct))
+        self.assertIsNone(snapshot.get_question(max(question_ids) + 1))
+
+
+class ChallengeProgressTests(TestCase):
+    def test_user_challenges_are_counted_once_per_visitor(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        for asked_count, question in enumerate(Question.objects.all()):
+            ChallengeSummary(
+                person=person,
+                question=question,
+                topic_id=question.topic_id,
+                asked_count=asked_count).save()
+
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(visitor.count_user_challenges(), 10)
+            self.assertEqual(visitor.count_user_challenges(), 10)
+
+
+    def test_only_asked_challenges_are_written(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        person.save()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        first = backend.core.visitor.get_new_challenge(visitor)
+        second = backend.core.visitor.get_new_challenge(visitor)
+
+        self.assertNotEqual(first.question.pk, second.question.pk)
+        self.assertEqual(list(ChallengeSummary.objects.filter(person=person)
+            .order_by('pk').values_list('question_id', 'asked_count')),
+            [(first.question.pk, 1), (second.question.pk, 1)])
+
+
+    @override_settings(CATALOG_CHECK_SECONDS=60)
+    def test_least_asked_challenge_is_picked_in_one_read(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        person.save()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        for _ in range(5):
+            backend.core.visitor.get_new_challenge(visitor)
+        ChallengeSummary.objects.filter(person=person).update(asked_count=2)
+        least_asked = ChallengeSummary.objects.filter(person=person).last()
+        least_asked.asked_count = 1
+        least_asked.save()
+
+        # One read to pick the question and one update to count it. The
+        # rows are more than the first rows read, and the topic is not
+        # counted or read whole.
+        with mock.patch.object(backend.core.scheduler, "TIE_ROWS", 2), \
+                self.assertNumQueries(2):
+            challenge = backend.core.visitor.get_new_challenge(visitor)
+        self.assertEqual(challenge.question.pk, least_asked.question_id)
+        least_asked.refresh_from_db()
+        self.assertEqual(least_asked.asked_count, 2)
+
+
+    def test_least_asked_challenge_is_picked_among_first_rows(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        questions = list(Question.objects.filter(topic=SAMPLE_TOPIC_TEXT))
+        for asked_count, question in enumerate(questions):
+            ChallengeSummary(person=person, question=question,
+                topic_id=question.topic_id,
+                asked_count=len(questions) - asked_count).save()
+
+        scheduler = backend.core.scheduler.LeastAskedScheduler()
+        topic_question_ids = tuple(question.pk for question in questions)
+        # only the first rows by asked count
+        with mock.patch.object(backend.core.scheduler, "TIE_ROWS", 2), \
+                self.assertNumQueries(1):
+            question_id = scheduler.pick_question(
+                person, SAMPLE_TOPIC_TEXT, topic_question_ids, [])
+        self.assertEqual(question_id, questions[-1].pk)
+
+
+    @skipUnless(connection.vendor == 'sqlite', "SQLite query plans")
+    def test_schedulers_read_rows_by_index(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        questions = list(Question.objects.filter(topic=SAMPLE_TOPIC_TEXT))
+        for question in questions:
+            ChallengeSummary(person=person, question=question,
+                topic_id=question.topic_id, asked_count=1).save()
+        topic_question_ids = tuple(question.pk for question in questions)
+
+        for scheduler, index in (
+                (backend.core.scheduler.LeastAskedScheduler(),
+                    'person_topic_asked_count'),
+                (backend.core.scheduler.SuperMemoScheduler(),
+                    'person_topic_due')):
+            with CaptureQueriesContext(connection) as queries:
+                scheduler.pick_question(
+                    person, SAMPLE_TOPIC_TEXT, topic_question_ids, [])
+            select = next(query['sql'] for query in queries
+                if "ORDER BY" in query['sql'])
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + select)
+                plan = " ".join(row[-1] for row in cursor.fetchall())
+            # rows are read in index order, not counted and sorted
+            self.assertIn(f"USING INDEX {index}", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+
+    @override_settings(DRILL_SCHEDULER="sm2")
+    def test_wrongly_answered_challenge_is_repeated_first(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        person.save()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.get_next_challenge()
+        challenge = backend.core.visitor.get_current_challenge(visitor)
+        backend.core.visitor.give_up_drill(visitor)
+
+        scheduler = backend.core.scheduler.get_scheduler()
+        for _ in range(4):
+            remembered = backend.core.visitor.get_new_challenge(visitor)
+            scheduler.record_answer(
+                person, remembered.question.pk, is_correct=True)
+        record = ChallengeSummary.objects.get(
+            person=person, question=remembered.question)
+        self.assertEqual(record.interval, 1)
+        self.assertEqual(record.repetitions, 1)
+
+        repeated = backend.core.visitor.get_new_challenge(visitor)
+        self.assertEqual(repeated.question.pk, challenge.question.pk)
+
+
+    def test_next_challenge_is_prepared_on_answer(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        visitor.get_next_challenge()
+        backend.core.visitor.give_up_drill(visitor)
+
+        next_question_id = backend.core.drill_state.load(
+            person).next_question_id
+        self.assertIsNotNone(next_question_id)
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        with mock.patch.object(backend.core.visitor, "choose_challenge") \
+                as choose_challenge:
+            page = visitor.get_next_challenge()
+        choose_challenge.assert_not_called()
+        self.assertEqual(page.challenge.question.pk, next_question_id)
+        self.assertEqual(visitor.count_user_challenges(), 2)
+
+        state = backend.core.drill_state.load(person)
+        self.assertIsNone(state.next_question_id)
+        self.assertEqual(state.current_question_id, next_question_id)
+
+
+    @override_settings(NO_CORRECT_ANSWER_RATE=0)
+    def test_next_challenge_after_wrong_answer_is_not_disclosed(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        page = visitor.get_next_challenge()
+        wrong_answer = next(answer for answer in page.challenge.answers
+            if not answer.is_correct)
+        page = backend.core.visitor.submit_drill_answer(
+            visitor, answer_id=wrong_answer.pk)
+        self.assertTrue(page.challenge.disclose_answers)
+
+        page = visitor.get_next_challenge()
+        self.assertFalse(page.challenge.disclose_answers)
+        self.assertFalse(backend.core.drill_state.load(
+            person).disclose_answers)
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        self.assertFalse(backend.core.visitor.get_current_challenge(
+            visitor).disclose_answers)
+
+
+    @override_settings(DRILL_SCHEDULER="sm2", NO_CORRECT_ANSWER_RATE=0)
+    def test_answer_after_reload_is_not_recorded_again(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        visitor.get_next_challenge()
+        backend.core.visitor.give_up_drill(visitor)
+
+        # the page is loaded again and the correct answer is chosen
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        page = visitor.show_challenge()
+        self.assertTrue(page.challenge.disclose_answers)
+        correct_answer = next(answer for answer in page.challenge.answers
+            if answer.is_correct)
+        backend.core.visitor.submit_drill_answer(
+            visitor, answer_id=correct_answer.pk)
+        summary = ChallengeSummary.objects.get(
+            person=person, question=page.challenge.question)
+        self.assertEqual(summary.repetitions, 0)
+
+
+    @skipUnless(REQUIRE_ROW_LOCKS, "REQUIRE_ROW_LOCKS is not set")
+    def test_database_has_row_locks(self):
+        self.assertTrue(connection.features.has_select_for_update)
+
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_drill_answer_locks_person(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        visitor.get_next_challenge()
+
+        with CaptureQueriesContext(connection) as queries:
+            backend.core.visitor.give_up_drill(visitor)
+        locks = [query['sql'] for query in queries
+            if "FOR UPDATE" in query['sql']]
+        self.assertIn('FROM "app_person"', locks[0])
+
+
+    def test_drill_runs_without_request(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        self.assertEqual(visitor.want_to_drill(SAMPLE_TOPIC_TEXT),
+            backend.core.visitor.Redirect("drill-topic"))
+
+        page = visitor.show_challenge()
+        self.assertIsNone(page.is_failure)
+        page = backend.core.visitor.give_up_drill(visitor)
+        self.assertTrue(page.is_failure)
+        self.assertTrue(page.challenge.disclose_answers)
+
+
+class AnswerSamplingTests(TestCase):
+    @override_settings(NO_CORRECT_ANSWER_RATE=0)
+    def test_sample_has_correct_answer(self):
+        for _ in range(20):
+            sample = backend.core.sampling.sample_answer_ids(
+                correct_ids=[1], wrong_ids=[2, 3, 4, 5, 6, 7])
+            self.assertEqual(len(sample), 4)
+            self.assertIn(1, sample)
+
+
+    @override_settings(NO_CORRECT_ANSWER_RATE=1)
+    def test_sample_may_have_no_correct_answer(self):
+        sample = backend.core.sampling.sample_answer_ids(
+            correct_ids=[1], wrong_ids=[2, 3, 4, 5])
+        self.assertEqual(sorted(sample), [2, 3, 4, 5])
+        # not enough wrong answers to leave the correct one out
+        sample = backend.core.sampling.sample_answer_ids(
+            correct_ids=[1], wrong_ids=[2, 3, 4])
+        self.assertEqual(sorted(sample), [1, 2, 3, 4])
+
+
+    def test_short_answer_set_is_shown_whole(self):
+        sample = backend.core.sampling.sample_answer_ids(
+            correct_ids=[1], wrong_ids=[2])
+        self.assertEqual(sorted(sample), [1, 2])
+
+
+class ContentLoadTests(TestCase):
+    def test_fixtures_are_parsed_as_stream(self):
+        for path in files('backend.app.fixtures').glob('*.json'):
+            with mock.patch.object(backend.core.validation, "READ_SIZE", 7):
+                stream = io.StringIO(path.read_text())
+                entries = list(backend.core.content.iter_json_array(stream))
+            self.assertEqual(entries, json.loads(path.read_text()))
+
+
+    def test_fixture_is_loaded_in_batches(self):
+        path = files('backend.app.fixtures') / 'git_challenges.json'
+        entries = json.loads(path.read_text())
+        with mock.patch.object(backend.core.content, "BATCH_SIZE", 10):
+            stats = backend.core.content.load_fixture(path)
+
+        self.assertEqual(stats.questions, len(entries))
+        self.assertEqual(Question.objects.count(), len(entries))
+        question = Question.objects.get(question_text=entries[-1]['q'])
+        self.assertEqual(
+            sorted(question.answer_set.values_list('answer_text', flat=True)),
+            sorted(entries[-1].get('+', []) + entries[-1]['-']))
+        # ids given by the loader do not clash with the ones given by DB
+        Question(question_text=SAMPLE_QUESTION_TEXT,
+            topic_id=question.topic_id).save()
+
+
+    def test_sync_applies_only_changed_entries(self):
+        path = files('backend.app.fixtures') / 'git_challenges.json'
+        backend.core.content.load_fixture(path)
+        entries = json.loads(path.read_text())
+        kept_ids = dict(Question.objects.values_list('question_text', 'pk'))
+        changed, removed = entries[0], entries[1]
+        changed['-'] = changed['-'][:-1] + ["A new wrong answer"]
+        entries.remove(removed)
+        entries.append({"topic": "git", "q": SAMPLE_QUESTION_TEXT,
+            "th": SAMPLE_EXPLANATION_TEXT, "+": ["Yes"], "-": ["No"]})
+
+        with tempfile.TemporaryDirectory() as directory:
+            changed_path = Path(directory) / 'git_challenges.json'
+            changed_path.write_text(json.dumps(entries))
+            stats = backend.core.content.sync_fixtures([changed_path])
+
+        self.assertEqual((stats.inserted, stats.updated, stats.deleted),
+            (1, 1, 1))
+        self.assertEqual(stats.unchanged, len(entries) - 2)
+        self.assertFalse(Question.objects.filter(pk=kept_ids[removed['q']]))
+        for entry in entries[:-1]:
+            question = Question.objects.get(pk=kept_ids[entry['q']])
+            self.assertEqual(
+                sorted(question.answer_set.values_list(
+                    'answer_text', flat=True)),
+                sorted(entry.get('+', []) + entry['-']))
+
+
+    def test_all_fixture_errors_are_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            challenges_path = Path(directory) / 'bad_challenges.json'
+            challenges_path.write_text(json.dumps([
+                {"topic": "git", "q": "Yes?", "th": "", "-": ["No"]},
+                {"topic": "git", "q": "No?", "th": "No", "+": "Yes",
+                    "-": ["No"]},
+            ]))
+            test_path = Path(directory) / 'bad_test.json'
+            test_path.write_text('[{"topic": "middle", "q": "Yes?"}]')
+            other_path = Path(directory) / 'other.json'
+            other_path.write_text('[]')
+
+            errors = backend.core.validation.validate_fixtures(
+                [challenges_path, test_path, other_path])
+
+        self.assertEqual(errors, [
+            "bad_challenges.json, entry 1: 'th' must be a non-empty text",
+            "bad_challenges.json, entry 2: '+' must be a list of texts",
+            "bad_test.json, entry 1: '+' must be a non-empty text",
+            "bad_test.json, entry 1: topic must be one of start, final",
+            "other.json: name tells neither test nor challenges fixture",
+        ])
+
+
+    def test_fixtures_are_valid(self):
+        paths = list(files('backend.app.fixtures').glob('*.json'))
+        self.assertEqual(backend.core.validation.validate_fixtures(paths), [])
+
+
+    def test_fixture_is_validated_as_stream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'cut_challenges.json'
+            path.write_text('[{"topic": "git", "q": "Yes?"}, {"topic": ')
+            with mock.patch.object(
+                    backend.core.validation, "READ_SIZE", 7):
+                errors = backend.core.validation.validate_fixture(str(path))
+
+        # entries before the broken one are checked
+        self.assertEqual(errors[:2], [
+            "cut_challenges.json, entry 1: 'th' must be a non-empty text",
+            "cut_challenges.json, entry 1: '-' must be a list of texts",
+        ])
+        self.assertTrue(errors[2].startswith("cut_challenges.json: "))
+
+
+# Views run in pool threads with their own DB connections, which do not
+# see the transaction of a TestCase
+
+class DrillPageTests(TransactionTestCase):
+    @override_settings(CATALOG_CHECK_SECONDS=60)
+    def test_drill_page_view_takes_fixed_number_of_queries(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        person.save()
+        self.client.force_login(person.user)
+        self.client.get(reverse("drill-topic"))
+
+        # session, user and person with the current challenge
+        with CaptureThreadQueries() as queries:
+            response = self.client.get(reverse("drill-topic"))
+        self.assertEqual(len(queries.sqls), 3, queries.sqls)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, SAMPLE_QUESTION_TEXT)
+
+
+    async def test_drill_page_is_served_by_async_view(self):
+        person = await sync_to_async(create_person)()
+        await sync_to_async(save_questions_and_answers_to_db)()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        await sync_to_async(person.save)()
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(person.user)
+
+        response = await client.get(reverse("drill-topic"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, SAMPLE_QUESTION_TEXT)
+        response = await client.get(
+            reverse("drill-topic") + "?choice=dont_know")
+        self.assertContains(response, "Your answer is not correct")
+
+
+class ViewThreadTests(TestCase):
+    async def test_views_run_in_parallel_pool_threads(self):
+        # each waits for the other, so they must run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        def wait_for_other():
+            barrier.wait()
+            return threading.get_ident()
+
+        thread_ids = await asyncio.gather(
+            backend.app.views.in_thread_pool(wait_for_other)(),
+            backend.app.views.in_thread_pool(wait_for_other)())
+        self.assertNotIn(threading.get_ident(), thread_ids)
+
+
+class ApiTests(TransactionTestCase):
+    @override_settings(NO_CORRECT_ANSWER_RATE=0)
+    def test_challenge_answers_are_disclosed_after_answer(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        person.save()
+        self.client.force_login(person.user)
+
+        challenge = self.client.get(reverse("api-challenge-next")).json()
+        self.assertEqual(challenge['question'], SAMPLE_QUESTION_TEXT)
+        self.assertFalse(challenge['disclose_answers'])
+        self.assertIsNone(challenge['explanation'])
+        self.assertNotIn('is_correct', challenge['answers'][0])
+        # not answered challenge is given again
+        again = self.client.get(reverse("api-challenge-next")).json()
+        self.assertEqual(again, challenge)
+
+        answer_id = next(answer['id'] for answer in challenge['answers']
+            if Answer.objects.get(pk=answer['id']).is_correct)
+        result = self.client.get(reverse("api-challenge-answer"),
+            {'choice': answer_id}).json()
+        self.assertTrue(result['disclose_answers'])
+        self.assertEqual(result['explanation'], SAMPLE_EXPLANATION_TEXT)
+        is_correct = Answer.objects.get(pk=answer_id).is_correct
+        self.assertEqual(result['is_failure'], not is_correct)
+        self.assertIn('is_correct', result['answers'][0])
+
+        # the challenge "Next" shows is read without being counted
+        prepared = self.client.get(reverse("api-challenge-prepared")).json()
+        self.assertNotEqual(
+            prepared['question_id'], challenge['question_id'])
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        self.assertEqual(visitor.count_user_challenges(), 1)
+
+        # the answered challenge is not given again
+        following = self.client.get(reverse("api-challenge-next")).json()
+        self.assertEqual(following, prepared)
+        self.assertFalse(following['disclose_answers'])
+
+
+    def test_answer_without_challenge_is_rejected(self):
+        person = create_person()
+        self.client.force_login(person.user)
+        response = self.client.get(reverse("api-challenge-answer"),
+            {'choice': 'dont_know'})
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_test_step_is_given(self):
+        person = create_person()
+        save_test_questions_to_db()
+        self.client.force_login(person.user)
+        step = self.client.get(reverse("api-test-step")).json()
+        self.assertEqual(step['test_question'], SAMPLE_TESTQUESTION_TEXT)
+        self.assertEqual(step['countdown'], "1 of 5")
+        step = self.client.get(reverse("api-test-step"),
+            {'test_answer': "128"}).json()
+        self.assertEqual(step['countdown'], "2 of 5")
+
+
+    def test_api_needs_logged_in_visitor(self):
+        response = self.client.get(reverse("api-challenge-next"))
+        self.assertEqual(response.status_code, 401)
+
+
+class FragmentCacheTests(TestCase):
+    def test_least_recently_used_fragment_is_dropped(self):
+        cache = backend.app.fragments.FragmentCache(maxsize=2)
+        cache.get("a", lambda: "A")
+        cache.get("b", lambda: "B")
+        self.assertEqual(cache.get("a", lambda: "new A"), "A")
+        cache.get("c", lambda: "C")
+        self.assertEqual(cache.get("b", lambda: "new B"), "new B")
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+
+    def test_question_markup_is_escaped_once(self):
+        Topic.objects.create(name=SAMPLE_TOPIC_TEXT)
+        Question(
+            question_text="Is 1 < 2?\nYes",
+            explanation_text=SAMPLE_EXPLANATION_TEXT,
+            topic_id=SAMPLE_TOPIC_TEXT).save()
+        question = Question.objects.get()
+        fragments = backend.app.fragments
+        fragments.fragment_cache.clear()
+
+        html = fragments.question_html(question)
+        self.assertEqual(html, "<p>Is 1 &lt; 2?</p>\n<p>Yes</p>")
+        self.assertIs(fragments.question_html(question), html)
+        self.assertEqual(fragments.fragment_cache.hits, 1)
+
+
+class ChecksTests(TestCase):
+    def test_debug_mode_is_warned_about(self):
+        with override_settings(DEBUG=True):
+            warnings = backend.app.checks.check_debug_is_off(None)
+        self.assertEqual([warning.id for warning in warnings], ['app.W001'])
+        with override_settings(DEBUG=False):
+            self.assertEqual(backend.app.checks.check_debug_is_off(None), [])
+
+
+class SqliteTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', "SQLite only")
+    def test_connection_is_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+    def test_locked_transaction_is_run_again(self):
+        results = [OperationalError("database is locked"), "done"]
+        def transaction():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        on_retry = mock.Mock()
+
+        with mock.patch.object(connection, "in_atomic_block", False), \
+                mock.patch("time.sleep"):
+            self.assertEqual(backend.core.sqlite.retry_when_locked(
+                transaction, on_retry), "done")
+        on_retry.assert_called_once()
+
+        # inside an outer transaction only the outer one can run again
+        results = [OperationalError("database is locked")]
+        with self.assertRaises(OperationalError):
+            backend.core.sqlite.retry_when_locked(transaction)
+
+
+class SqliteWriteLockTests(TransactionTestCase):
+    @skipUnless(connection.vendor == 'sqlite', "SQLite only")
+    def test_drill_step_takes_write_lock_without_writing_person(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+
+        with CaptureQueriesContext(connection) as queries:
+            visitor.get_next_challenge()
+            backend.core.visitor.give_up_drill(visitor)
+        sqls = [query['sql'] for query in queries]
+        self.assertEqual(sqls.count("BEGIN IMMEDIATE"), 2)
+        self.assertFalse([sql for sql in sqls
+            if sql.startswith('UPDATE "app_person"')])
+
+
+class AskedCountBufferTests(TestCase):
+    def make_buffer(self):
+        return backend.core.asked_counts.AskedCountBuffer(
+            flush_events=100, flush_seconds=60)
+
+
+    def test_increments_are_written_in_batch(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        first, second, third = Question.objects.all()[:3]
+        for question in (first, second, third):
+            ChallengeSummary(person=person, question=question,
+                topic_id=question.topic_id, asked_count=1).save()
+        buffer = self.make_buffer()
+        for question in (first, second, second, third):
+            buffer.add(person.pk, question.pk)
+
+        self.assertEqual(buffer.pending(person.pk),
+            {first.pk: 1, second.pk: 2, third.pk: 1})
+        with CaptureQueriesContext(connection) as queries:
+            buffer.flush()
+        # an UPDATE per increment size
+        self.assertEqual(len([query for query in queries.captured_queries
+            if query['sql'].startswith("UPDATE")]), 2)
+        self.assertEqual(buffer.pending(person.pk), {})
+        self.assertEqual(dict(ChallengeSummary.objects.filter(person=person)
+            .values_list('question_id', 'asked_count')),
+            {first.pk: 2, second.pk: 3, third.pk: 2})
+
+
+    @override_settings(CATALOG_CHECK_SECONDS=60)
+    def test_pending_increments_are_read_by_same_person(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        person.challenge_topic = SAMPLE_TOPIC_TEXT
+        person.save()
+        questions = list(Question.objects.filter(topic=SAMPLE_TOPIC_TEXT))
+        for question in questions:
+            ChallengeSummary(person=person, question=question,
+                topic_id=question.topic_id, asked_count=1).save()
+        buffer = self.make_buffer()
+        for question in questions[1:]:
+            buffer.add(person.pk, question.pk)
+
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        with mock.patch.object(backend.core.asked_counts, "get_buffer",
+                return_value=buffer):
+            self.assertEqual(visitor.count_user_challenges(),
+                2 * len(questions) - 1)
+            challenge = backend.core.visitor.get_new_challenge(visitor)
+        self.assertEqual(challenge.question.pk, questions[0].pk)
+
+
+class DrillStateTests(TestCase):
+    @override_settings(DRILL_STATE_CHECKPOINT_STEPS=3)
+    def test_person_row_is_written_on_checkpoint(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        person.refresh_from_db()
+        self.assertEqual(person.challenge_topic, SAMPLE_TOPIC_TEXT)
+
+        visitor.get_next_challenge()
+        backend.core.visitor.give_up_drill(visitor)
+        person.refresh_from_db()
+        self.assertIsNone(person.current_question_id)
+
+        # the third step since the topic was chosen
+        visitor.get_next_challenge()
+        state = backend.core.drill_state.load(person)
+        person.refresh_from_db()
+        self.assertEqual(person.current_question_id,
+            state.current_question_id)
+        self.assertEqual(person.current_answers, state.current_answers)
+        self.assertEqual(state.unsaved_steps, 0)
+
+
+    def test_drill_resumes_at_checkpoint_when_cache_is_lost(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        visitor.get_next_challenge()
+        cache.clear()
+
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        self.assertEqual(visitor.get_drill_state().topic, SAMPLE_TOPIC_TEXT)
+        page = visitor.show_challenge()
+        self.assertEqual(page.challenge.question.topic_id, SAMPLE_TOPIC_TEXT)
+
+
+    @override_settings(DRILL_STATE_CHECKPOINT_STEPS=1)
+    def test_failed_drill_action_drops_cached_state(self):
+        person = create_person()
+        save_questions_and_answers_to_db()
+        visitor = backend.core.visitor.Visitor(user=person.user)
+        visitor.want_to_drill(SAMPLE_TOPIC_TEXT)
+        visitor.get_next_challenge()
+        # all but the never asked questions, which are read again
+        checkpoint = dataclasses.replace(
+            backend.core.drill_state.load(person),
+            never_asked=None, catalog_stamp="")
+
+        # fails after the state with the next challenge was saved
+        with mock.patch.object(backend.core.visitor, "ChallengePage",
+                side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                backend.core.visitor.give_up_drill(visitor)
+        person.refresh_from_db()
+        state = backend.core.drill_state.load(person)
+        self.assertIsNone(state.next_question_id)
+        self.assertEqual(state, checkpoint)
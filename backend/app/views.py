@@ -1,14 +1,19 @@
 from __future__ import annotations
 import urllib.parse
 
+from asgiref.sync import sync_to_async
 import django.contrib.auth
+from django.db import close_old_connections
 from django.shortcuts import render, redirect
 from django.urls import reverse
-from threadlocals.threadlocals import get_current_request
 
 import backend.core
 import backend.core.visitor
-from .models import Person, Invite, TestSummary
+from backend.core.visitor import ChallengePage, HomepageInfo, InviteList
+from backend.core.visitor import Redirect, TestExplanationPage
+from backend.core.visitor import TestScore, TestStepPage
+from . import fragments
+from .models import Person
 
 
 def need_logged_in_visitor(handler):
@@ -20,18 +25,61 @@ def need_logged_in_visitor(handler):
     return decorated
 
 
-@need_logged_in_visitor
-def homepage(_, visitor: backend.core.visitor.Visitor):
-    return visitor.get_button_test_info()
+def find_visitor(request):
+    if not request.user.is_authenticated:
+        return None
+    return backend.core.visitor.Visitor(user=request.user)
+
+
+def in_thread_pool(function):
+    """Makes a synchronous view step awaitable in a pool thread.
+
+    Unlike the default single thread for synchronous code, requests run
+    in parallel, each in a thread with its own DB connection. The
+    connection is closed as Django closes it after a synchronous request.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def need_logged_in_visitor_async(handler):
+    # Django ORM is synchronous, so the visitor is looked up and
+    # the handler runs in a thread while the event loop serves others.
+    def find_and_handle(request):
+        visitor = find_visitor(request)
+        if not visitor:
+            return redirect(reverse("login-visitor"))
+        return handler(request, visitor)
+
+    async def decorated(request):
+        return await in_thread_pool(find_and_handle)(request)
+    return decorated
+
+
+def respond(request, result):
+    # Visitor actions return plain results, they are rendered here
+    if isinstance(result, Redirect):
+        return redirect(reverse(result.url_name))
+    return RENDERERS[type(result)](request, result)
+
+
+@need_logged_in_visitor_async
+def homepage(request, visitor: backend.core.visitor.Visitor):
+    return respond(request, visitor.get_button_test_info())
 
 
-def render_homepage(button_test_info: str):
-    context = {'button_test_info': button_test_info}
-    return render(get_current_request(), 'homepage.html', context)
+def render_homepage(request, info: HomepageInfo):
+    context = {'button_test_info': info.button_test_info}
+    return render(request, 'homepage.html', context)
 
 
-def about(_):
-    return render(get_current_request(), 'about.html')
+def about(request):
+    return render(request, 'about.html')
 
 
 def register_visitor(request):
@@ -41,18 +89,22 @@ def register_visitor(request):
     credentials = (username, password, invite)
 
     if not any(credentials):
-        return render_register_visitor()
+        return render_register_visitor(request)
     elif all(credentials):
         username = urllib.parse.unquote(username)
         password = urllib.parse.unquote(password)
         invite = urllib.parse.unquote(invite)
-        return backend.core.visitor.Visitor.register(
+        person = backend.core.visitor.Visitor.register(
             username, password, invite)
+        if not person:
+            return render_register_visitor(request, invalid_code=True)
+        connect_person_to_session(request, person)
+        return redirect(reverse("homepage"))
     else:
-        return render_register_visitor(empty_field=True, invalid_code=False)
+        return render_register_visitor(request, empty_field=True)
 
 
-def render_register_visitor(
+def render_register_visitor(request,
         empty_field: bool = False,
         invalid_code: bool = False):
 
@@ -60,7 +112,7 @@ def render_register_visitor(
         "empty_field": empty_field,
         "invalid_code": invalid_code,
     }
-    return render(get_current_request(), 'register_visitor.html', context)
+    return render(request, 'register_visitor.html', context)
 
 
 def login_visitor(request):
@@ -69,31 +121,32 @@ def login_visitor(request):
     credentials = (username, password)
 
     if not any(credentials):
-        return render_login_visitor()
+        return render_login_visitor(request)
     elif all(credentials):
         username = urllib.parse.unquote(username)
         password = urllib.parse.unquote(password)
-        return backend.core.visitor.Visitor.login(username, password)
+        person = backend.core.visitor.Visitor.login(username, password)
+        if not person:
+            return render_login_visitor(request, invalid_credentials=True)
+        connect_person_to_session(request, person)
+        return redirect(reverse("homepage"))
     else:
-        return render_login_visitor(invalid_credentials=True)
+        return render_login_visitor(request, invalid_credentials=True)
 
 
-def render_login_visitor(invalid_credentials: bool = False):
+def render_login_visitor(request, invalid_credentials: bool = False):
     context = {"invalid_credentials": invalid_credentials}
-    return render(get_current_request(), 'login_visitor.html', context)
+    return render(request, 'login_visitor.html', context)
 
 
 @need_logged_in_visitor
-def logout_visitor(_, visitor: backend.core.visitor.Visitor):
-    return visitor.logout()
+def logout_visitor(request, _):
+    django.contrib.auth.logout(request)
+    return redirect(reverse("homepage"))
 
 
-def connect_person_to_session(person: Person):
-    django.contrib.auth.login(get_current_request(), person.user)
-
-
-def disconnect_person_from_session(_):
-    django.contrib.auth.logout(get_current_request())
+def connect_person_to_session(request, person: Person):
+    django.contrib.auth.login(request, person.user)
 
 
 @need_logged_in_visitor
@@ -101,33 +154,31 @@ def add_invite(request, visitor: backend.core.visitor.Visitor):
     comment = request.GET.get('comment')
     if not comment:
         return redirect(reverse("view-invites"))
-    visitor.add_invite(comment=comment)
-    return visitor.show_invites()
+    return respond(request, visitor.add_invite(comment=comment))
 
 
 @need_logged_in_visitor
-def view_invites(_, visitor: backend.core.visitor.Visitor):
-    return visitor.show_invites()
+def view_invites(request, visitor: backend.core.visitor.Visitor):
+    return respond(request, visitor.show_invites())
 
 
-def render_invites(invites: Invite):
-    context = {'invites': invites}
-    return render(get_current_request(), 'view_invites.html', context)
+def render_invites(request, invite_list: InviteList):
+    context = {'invites': invite_list.invites}
+    return render(request, 'view_invites.html', context)
 
 
 @need_logged_in_visitor
-def explain_test(_, visitor: backend.core.visitor.Visitor):
-    return visitor.show_test_explanation()
+def explain_test(request, visitor: backend.core.visitor.Visitor):
+    return respond(request, visitor.show_test_explanation())
 
 
-def render_explain_test(
-        explanation: backend.core.visitor.TestExplanationPage):
+def render_explain_test(request, explanation: TestExplanationPage):
     context = {
         'foreword': explanation.foreword.split("\n"),
         'url_name_to_go_to': explanation.url_name_to_go_to,
         'btn_text': explanation.btn_text,
     }
-    return render(get_current_request(), 'explain_test.html', context)
+    return render(request, 'explain_test.html', context)
 
 
 @need_logged_in_visitor
@@ -137,62 +188,83 @@ def select_topic(request, visitor: backend.core.visitor.Visitor):
         return redirect(reverse("explain-test"))
     topic = request.GET.get('topic')
     if topic:
-        return visitor.want_to_drill(topic=topic)
+        return respond(request, visitor.want_to_drill(topic=topic))
     return render(request, 'select_topic.html')
 
 
-@need_logged_in_visitor
+@need_logged_in_visitor_async
 def test(request, visitor: backend.core.visitor.Visitor):
     test_answer = request.GET.get('test_answer')
     if not test_answer:
-        return visitor.show_test_step()
-    return visitor.submit_test_answer(test_answer)
+        return respond(request, visitor.show_test_step())
+    return respond(request, visitor.submit_test_answer(test_answer))
 
 
-def render_test_step(test_step: TestSummary, countdown: str):
+def render_test_step(request, page: TestStepPage):
     context = {
-        'test_question': test_step.test_question.test_question.split("\n"),
-        'countdown': countdown,
+        'test_question': fragments.test_question_html(
+            page.test_step.test_question),
+        'countdown': page.countdown,
     }
-    return render(get_current_request(), 'test.html', context)
+    return render(request, 'test.html', context)
 
 
-def render_test_score(test_score: tuple):
-    start_score, final_score = test_score
+def render_test_score(request, score: TestScore):
     context = {
-        'start_score': start_score,
-        'final_score': final_score,
+        'start_score': score.start_score,
+        'final_score': score.final_score,
     }
-    return render(get_current_request(), 'test.html', context)
+    return render(request, 'test.html', context)
 
 
-@need_logged_in_visitor
+@need_logged_in_visitor_async
 def drill_topic(request, visitor: backend.core.visitor.Visitor):
     answer_choice = request.GET.get('choice')
 
     if request.GET.get('next') == "next":
-        return visitor.get_next_challenge()
-    elif answer_choice == 'dont_know':
+        page = visitor.get_next_challenge()
+    elif answer_choice:
+        page = answer_drill(visitor, answer_choice)
+    else:
+        page = visitor.show_challenge()
+    return respond(request, page)
+
+
+def answer_drill(visitor: backend.core.visitor.Visitor, answer_choice: str):
+    if answer_choice == 'dont_know':
         return backend.core.visitor.give_up_drill(visitor)
     elif answer_choice == 'no_correct_answer':
         return backend.core.visitor.submit_drill_answer(visitor,
             no_correct_answer=True)
-    elif answer_choice:
-        answer_id = int(answer_choice)  # need to get the answer as digit
-        return backend.core.visitor.submit_drill_answer(visitor,
-            answer_id=answer_id)
-    return visitor.show_challenge()
+    answer_id = int(answer_choice)  # need to get the answer as digit
+    return backend.core.visitor.submit_drill_answer(visitor,
+        answer_id=answer_id)
 
 
-def render_challenge(challenge: backend.core.visitor.Challenge,
-        is_failure: bool = None, with_error: str = None):
-
+def render_challenge(request, page: ChallengePage):
+    # content blocks come rendered from the fragment cache
+    challenge = page.challenge
+    explanation = ""
+    if challenge.disclose_answers:
+        explanation = fragments.explanation_html(challenge.question)
     context = {
-        'question': challenge.question.question_text.split("\n"),
+        'question': fragments.question_html(challenge.question),
         'answers': challenge.answers,
-        'explanation': challenge.question.explanation_text.split("\n"),
+        'answer_texts': [fragments.answer_html(answer)
+            for answer in challenge.answers],
+        'explanation': explanation,
         'disclose_answers': challenge.disclose_answers,
-        'is_failure': is_failure,
-        'error_msg': with_error,
+        'is_failure': page.is_failure,
+        'error_msg': page.with_error,
     }
-    return render(get_current_request(), 'drill_topic.html', context)
+    return render(request, 'drill_topic.html', context)
+
+
+RENDERERS = {
+    HomepageInfo: render_homepage,
+    InviteList: render_invites,
+    TestExplanationPage: render_explain_test,
+    TestStepPage: render_test_step,
+    TestScore: render_test_score,
+    ChallengePage: render_challenge,
+}
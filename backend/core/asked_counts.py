@@ -0,0 +1,176 @@
+"""Write-behind buffer for ChallengeSummary.asked_count.
+
+With ASKED_COUNT_BUFFER on, a shown challenge is counted in worker
+memory and the counts are written in batches: after
+ASKED_COUNT_FLUSH_EVENTS increments, ASKED_COUNT_FLUSH_SECONDS after
+the first pending one and when the worker exits.
+
+A row is still written when a question is asked for the first time,
+only its increments are buffered. Pending counts are added to what is
+read from DB for the same person in this worker; other workers see
+them after the flush.
+"""
+from __future__ import annotations
+import atexit
+from collections import defaultdict
+import logging
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from backend.app.models import ChallengeSummary
+
+
+logger = logging.getLogger(__name__)
+
+# (person id, question id) -> pending increment
+Increments = dict[tuple[int, int], int]
+
+
+class AskedCountBuffer:
+
+    def __init__(self, flush_events: int, flush_seconds: float):
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self._increments: Increments = {}
+        # taken by the running flush, still pending till written
+        self._flushing: Increments = {}
+        self._events = 0
+        self._first_event_at: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+
+    def add(self, person_id: int, question_id: int):
+        with self._lock:
+            key = (person_id, question_id)
+            self._increments[key] = self._increments.get(key, 0) + 1
+            self._events += 1
+            if self._first_event_at is None:
+                self._first_event_at = time.monotonic()
+                self._start_timer()
+            due = self._events >= self.flush_events or \
+                time.monotonic() - self._first_event_at >= self.flush_seconds
+        if due:
+            self.flush_safely()
+
+
+    def pending(self, person_id: int) -> dict[int, int]:
+        """Not written increments of the person by question id"""
+        counts: dict[int, int] = {}
+        with self._lock:
+            for increments in (self._increments, self._flushing):
+                for (key_person_id, question_id), count \
+                        in increments.items():
+                    if key_person_id == person_id:
+                        counts[question_id] = \
+                            counts.get(question_id, 0) + count
+        return counts
+
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._increments = self._increments, {}
+                self._events = 0
+                self._first_event_at = None
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+            if not self._flushing:
+                return
+            try:
+                write_increments(self._flushing)
+            except Exception:
+                # keep them for the next flush
+                with self._lock:
+                    self._put_back(self._flushing)
+                    self._flushing = {}
+                raise
+            with self._lock:
+                self._flushing = {}
+
+
+    def flush_safely(self):
+        # for flushes no request waits for
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Asked counts are not written, kept to retry")
+
+
+    def _put_back(self, increments: Increments):
+        for key, count in increments.items():
+            self._increments[key] = self._increments.get(key, 0) + count
+            self._events += count
+        if self._first_event_at is None:
+            self._first_event_at = time.monotonic()
+            self._start_timer()
+
+
+    def _start_timer(self):
+        # flushes counts of a worker which got no more requests
+        self._timer = threading.Timer(self.flush_seconds, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+    def _on_timer(self):
+        try:
+            self.flush_safely()
+        finally:
+            # the timer thread has its own DB connection
+            connection.close()
+
+
+def write_increments(increments: Increments):
+    """Add the increments to DB with one UPDATE per increment size"""
+    person_ids = {person_id for person_id, _ in increments}
+    question_ids = {question_id for _, question_id in increments}
+    with transaction.atomic():
+        ids_by_count = defaultdict(list)
+        for pk, person_id, question_id in ChallengeSummary.objects.filter(
+                person_id__in=person_ids, question_id__in=question_ids
+                ).values_list('pk', 'person_id', 'question_id'):
+            # rows removed by a content reload since are skipped
+            count = increments.get((person_id, question_id))
+            if count:
+                ids_by_count[count].append(pk)
+        for count, ids in ids_by_count.items():
+            ChallengeSummary.objects.filter(pk__in=ids).update(
+                asked_count=F('asked_count') + count)
+
+
+_buffer: Optional[AskedCountBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> Optional[AskedCountBuffer]:
+    global _buffer
+    if not settings.ASKED_COUNT_BUFFER:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = AskedCountBuffer(settings.ASKED_COUNT_FLUSH_EVENTS,
+                settings.ASKED_COUNT_FLUSH_SECONDS)
+            atexit.register(_buffer.flush_safely)
+        return _buffer
+
+
+def count_asked(person_id: int, question_id: int):
+    buffer = get_buffer()
+    if buffer is None:
+        raise AssertionError("Asked counts are not buffered")
+    # counted once the drill step is committed, as a rolled back
+    # step is run again
+    transaction.on_commit(lambda: buffer.add(person_id, question_id))
+
+
+def pending_counts(person_id: int) -> dict[int, int]:
+    buffer = get_buffer()
+    return buffer.pending(person_id) if buffer else {}
@@ -0,0 +1,195 @@
+"""In-process cache of drill content: questions, answers and test steps.
+
+Content is written only by the load command and from admin, so every
+worker keeps an immutable index of it in memory. A version stamp kept
+in DB is replaced on each content change; workers compare it with the
+stamp of their index at most every CATALOG_CHECK_SECONDS and rebuild
+the index when the stamp differs.
+
+If the CATALOG_SNAPSHOT file written by the build_catalog command has
+the current stamp, workers map it into memory instead of reading DB.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+import threading
+import time
+from types import MappingProxyType
+from pathlib import Path
+from typing import Mapping, Optional, Union
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from backend.app.models import Answer, CatalogVersion, Question, TestStep
+from backend.core.snapshot import SnapshotCatalog
+
+
+@dataclass(frozen=True)
+class Catalog:
+    stamp: str
+    questions: Mapping[int, Question]
+    answers: Mapping[int, Answer]
+    # topic -> ids of questions in this topic
+    topic_questions: Mapping[str, tuple[int, ...]]
+    # question id -> ids of answers to the question
+    question_answers: Mapping[int, tuple[int, ...]]
+    # question id -> ids of its correct answers
+    question_correct_answers: Mapping[int, tuple[int, ...]]
+    # test topic ("start" or "final") -> ids of test steps
+    topic_test_steps: Mapping[str, tuple[int, ...]]
+
+    @staticmethod
+    def load(stamp: str) -> Catalog:
+        # One read transaction, which on SQLite sees the content as of
+        # its first query. Other databases may see a reload committed
+        # between the queries, so answers are checked against questions.
+        with transaction.atomic():
+            questions = {q.pk: q for q in Question.objects.order_by('pk')}
+            answer_rows = list(Answer.objects.order_by('pk'))
+            test_step_rows = list(
+                TestStep.objects.order_by('pk').values('pk', 'topic'))
+        answers: dict[int, Answer] = {}
+        topic_questions: dict[str, list[int]] = {}
+        question_answers: dict[int, list[int]] = {}
+        question_correct_answers: dict[int, list[int]] = {}
+        topic_test_steps: dict[str, list[int]] = {}
+
+        for question in questions.values():
+            topic_questions.setdefault(
+                question.topic_id, []).append(question.pk)
+            question_answers[question.pk] = []
+            question_correct_answers[question.pk] = []
+        for answer in answer_rows:
+            # answers of a question added after the questions were read,
+            # the changed stamp makes the next check load them
+            if answer.question_id not in questions:
+                continue
+            # share the cached question instead of a lazy DB fetch
+            answer.question = questions[answer.question_id]
+            answers[answer.pk] = answer
+            question_answers[answer.question_id].append(answer.pk)
+            if answer.is_correct:
+                question_correct_answers[answer.question_id].append(answer.pk)
+        for test_step in test_step_rows:
+            topic_test_steps.setdefault(
+                test_step['topic'], []).append(test_step['pk'])
+
+        return Catalog(
+            stamp=stamp,
+            questions=MappingProxyType(questions),
+            answers=MappingProxyType(answers),
+            topic_questions=_freeze(topic_questions),
+            question_answers=_freeze(question_answers),
+            question_correct_answers=_freeze(question_correct_answers),
+            topic_test_steps=_freeze(topic_test_steps),
+        )
+
+    def get_question(self, question_id: int) -> Optional[Question]:
+        return self.questions.get(question_id)
+
+    def get_answer(self, answer_id: int) -> Optional[Answer]:
+        return self.answers.get(answer_id)
+
+    def get_answers(self, question_id: int) -> list[Answer]:
+        return [self.answers[answer_id] for answer_id
+            in self.question_answers.get(question_id, ())]
+
+    def get_answer_ids(self, question_id: int) -> tuple[
+            tuple[int, ...], tuple[int, ...]]:
+        """Ids of correct and of wrong answers to the question"""
+        answer_ids = self.question_answers.get(question_id, ())
+        correct_ids = self.question_correct_answers.get(question_id, ())
+        wrong_ids = tuple(answer_id for answer_id in answer_ids
+            if answer_id not in correct_ids)
+        return correct_ids, wrong_ids
+
+    def get_topic_question_ids(self, topic: str) -> tuple[int, ...]:
+        return self.topic_questions.get(topic, ())
+
+    def get_test_step_ids(self, topic: str) -> tuple[int, ...]:
+        return self.topic_test_steps.get(topic, ())
+
+    def count_test_steps(self) -> dict[str, int]:
+        return {topic: len(test_step_ids)
+            for topic, test_step_ids in self.topic_test_steps.items()}
+
+
+def _freeze(index: dict) -> Mapping:
+    return MappingProxyType({key: tuple(ids) for key, ids in index.items()})
+
+
+_catalog: Optional[Union[Catalog, SnapshotCatalog]] = None
+_checked_at: float = 0.0
+_lock = threading.Lock()
+# content writes inside content_reload() bump the stamp only once
+_reload_in_progress = False
+
+
+def get_catalog() -> Union[Catalog, SnapshotCatalog]:
+    global _catalog, _checked_at
+    with _lock:
+        now = time.monotonic()
+        catalog = _catalog
+        if catalog and now - _checked_at < settings.CATALOG_CHECK_SECONDS:
+            return catalog
+        stamp = read_stamp()
+        if not catalog or catalog.stamp != stamp:
+            catalog = _catalog = open_snapshot(stamp) or Catalog.load(stamp)
+        _checked_at = now
+        return catalog
+
+
+def open_snapshot(stamp: str) -> Optional[SnapshotCatalog]:
+    if not settings.CATALOG_SNAPSHOT:
+        return None
+    path = Path(settings.CATALOG_SNAPSHOT)
+    if not path.exists():
+        return None
+    snapshot = SnapshotCatalog.open(path)
+    # the file was built before the last content change
+    if snapshot.stamp != stamp:
+        return None
+    return snapshot
+
+
+def read_stamp() -> str:
+    stamp = CatalogVersion.objects.values_list('stamp', flat=True).first()
+    return stamp or ""
+
+
+def bump_stamp():
+    """Make every worker rebuild its catalog on the next check"""
+    global _catalog
+    CatalogVersion.objects.update_or_create(
+        pk=1, defaults={'stamp': uuid4().hex})
+    with _lock:
+        _catalog = None
+
+
+@contextmanager
+def content_reload():
+    """Bump catalog version once for a batch of content writes"""
+    global _reload_in_progress
+    _reload_in_progress = True
+    try:
+        yield
+    finally:
+        _reload_in_progress = False
+        bump_stamp()
+
+
+def _on_content_change(**_):
+    if not _reload_in_progress:
+        bump_stamp()
+
+
+def connect_signals():
+    # admin saves and deletes come through model signals
+    for model in (Question, Answer, TestStep):
+        post_save.connect(_on_content_change, sender=model,
+            dispatch_uid=f"catalog-save-{model.__name__}")
+        post_delete.connect(_on_content_change, sender=model,
+            dispatch_uid=f"catalog-delete-{model.__name__}")
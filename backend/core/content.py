@@ -0,0 +1,294 @@
+"""Loading of drill content from JSON fixture files.
+
+A fixture is a JSON array of entries. Challenge entries have a topic,
+a question "q", an explanation "th", correct answers "+" (optional,
+there can be no correct answer not to prompt the user) and wrong
+answers "-". Test entries have a topic, a question "q" and an answer "+".
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import hashlib
+import json
+import time
+from typing import Iterator
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Model
+
+from backend.app.models import Answer, Question, TestStep, Topic
+from backend.core.validation import get_fixture_kind, iter_json_array
+
+
+BATCH_SIZE = 500
+
+
+@dataclass
+class LoadStats:
+    file_name: str
+    questions: int = 0
+    answers: int = 0
+    test_steps: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows(self) -> int:
+        return self.questions + self.answers + self.test_steps
+
+    def __str__(self):
+        rows_per_second = self.rows / self.seconds if self.seconds else 0
+        return f"{self.file_name}: {self.questions} questions, " + \
+            f"{self.answers} answers, {self.test_steps} test steps " + \
+            f"in {self.seconds:.2f}s ({rows_per_second:.0f} rows/s)"
+
+
+class BatchWriter:
+    """Collects new rows and inserts them with bulk_create.
+
+    Primary keys are given here because bulk_create does not return them
+    on SQLite, while answers need ids of their questions.
+    """
+
+    def __init__(self, *models: type[Model]):
+        self.pending: dict[type[Model], list[Model]] = {
+            model: [] for model in models}
+        self.next_ids = {model: (model.objects.aggregate(
+            max_id=Max('id'))['max_id'] or 0) + 1 for model in models}
+
+    def add(self, row: Model) -> Model:
+        model = type(row)
+        row.pk = self.next_ids[model]
+        self.next_ids[model] += 1
+        self.pending[model].append(row)
+        if len(self.pending[model]) >= BATCH_SIZE:
+            self.flush()
+        return row
+
+    def flush(self):
+        # models go in the given order, so questions precede answers
+        for model, rows in self.pending.items():
+            model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            rows.clear()
+
+    def close(self):
+        self.flush()
+        # let the DB continue numbering after the ids given here
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), list(self.pending)):
+                cursor.execute(sql)
+
+
+class TopicWriter:
+    """Creates topics of loaded entries which are not in DB yet"""
+
+    def __init__(self):
+        self.names = set(Topic.objects.values_list('name', flat=True))
+
+    def add(self, name: str) -> str:
+        if name not in self.names:
+            Topic.objects.create(name=name)
+            self.names.add(name)
+        return name
+
+
+def load_fixture(path) -> LoadStats:
+    """Insert entries of a fixture file in one transaction"""
+    started = time.perf_counter()
+    stats = LoadStats(path.name)
+    kind = get_fixture_kind(path.name)
+    with transaction.atomic(), path.open(encoding="utf-8") as stream:
+        if kind == "test":
+            load_test_steps(iter_json_array(stream), stats)
+        elif kind == "challenges":
+            load_challenges(iter_json_array(stream), stats)
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def load_test_steps(entries: Iterator[dict], stats: LoadStats):
+    writer = BatchWriter(TestStep)
+    topics = TopicWriter()
+    for test_step in entries:
+        writer.add(TestStep(
+            test_question=test_step['q'],
+            topic_id=topics.add(test_step['topic']),
+            test_answer=test_step['+']))
+        stats.test_steps += 1
+    writer.close()
+
+
+def load_challenges(entries: Iterator[dict], stats: LoadStats):
+    writer = BatchWriter(Question, Answer)
+    topics = TopicWriter()
+    for challenge in entries:
+        question = writer.add(Question(
+            question_text=challenge['q'],
+            explanation_text=challenge['th'],
+            topic_id=topics.add(challenge['topic'])))
+        stats.questions += 1
+
+        answers = [(answer, True) for answer in challenge.get('+', [])] + \
+            [(answer, False) for answer in challenge['-']]
+        for answer_text, is_correct in answers:
+            writer.add(Answer(
+                question_id=question.pk,
+                answer_text=answer_text,
+                is_correct=is_correct))
+            stats.answers += 1
+    writer.close()
+
+
+@dataclass
+class SyncStats:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.updated} updated, " + \
+            f"{self.deleted} deleted, {self.unchanged} unchanged " + \
+            f"in {self.seconds:.2f}s"
+
+
+def content_hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def challenge_hash(explanation: str, answers: list[tuple[str, bool]]) -> str:
+    return content_hash(explanation, sorted(answers))
+
+
+def sync_fixtures(paths) -> SyncStats:
+    """Bring content in DB to the fixtures with as few writes as possible.
+
+    Questions and test steps are matched by topic and question text.
+    Matched rows keep their ids, so learner progress linked to them
+    stays; rows missing in the fixtures are deleted.
+    """
+    started = time.perf_counter()
+    stats = SyncStats()
+    with transaction.atomic():
+        challenges = ChallengeSync(stats)
+        test_steps = TestStepSync(stats)
+        for path in paths:
+            kind = get_fixture_kind(path.name)
+            with path.open(encoding="utf-8") as stream:
+                if kind == "test":
+                    for entry in iter_json_array(stream):
+                        test_steps.apply(entry)
+                elif kind == "challenges":
+                    for entry in iter_json_array(stream):
+                        challenges.apply(entry)
+        challenges.close()
+        test_steps.close()
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+class ChallengeSync:
+
+    def __init__(self, stats: SyncStats):
+        self.stats = stats
+        self.writer = BatchWriter(Question, Answer)
+        self.topics = TopicWriter()
+        self.questions = {
+            (question.topic_id, question.question_text): question
+            for question in Question.objects.all()}
+        self.answers: dict[int, list[Answer]] = {}
+        for answer in Answer.objects.order_by('pk'):
+            self.answers.setdefault(answer.question_id, []).append(answer)
+        self.seen_keys: set[tuple[str, str]] = set()
+
+    def apply(self, challenge: dict):
+        key = (challenge['topic'], challenge['q'])
+        self.seen_keys.add(key)
+        answers = [(answer, True) for answer in challenge.get('+', [])] + \
+            [(answer, False) for answer in challenge['-']]
+
+        question = self.questions.get(key)
+        if not question:
+            question = self.writer.add(Question(
+                question_text=challenge['q'],
+                explanation_text=challenge['th'],
+                topic_id=self.topics.add(challenge['topic'])))
+            self.add_answers(question, answers)
+            self.stats.inserted += 1
+            return
+
+        saved_answers = self.answers.get(question.pk, [])
+        saved_hash = challenge_hash(question.explanation_text, [
+            (answer.answer_text, answer.is_correct)
+            for answer in saved_answers])
+        if saved_hash == challenge_hash(challenge['th'], answers):
+            self.stats.unchanged += 1
+            return
+
+        if question.explanation_text != challenge['th']:
+            question.explanation_text = challenge['th']
+            question.save(update_fields=['explanation_text'])
+        # keep answers which did not change, replace the rest
+        answers_to_add = list(answers)
+        answers_to_delete = []
+        for answer in saved_answers:
+            saved_answer = (answer.answer_text, answer.is_correct)
+            if saved_answer in answers_to_add:
+                answers_to_add.remove(saved_answer)
+            else:
+                answers_to_delete.append(answer.pk)
+        Answer.objects.filter(pk__in=answers_to_delete).delete()
+        self.add_answers(question, answers_to_add)
+        self.stats.updated += 1
+
+    def add_answers(self, question: Question,
+            answers: list[tuple[str, bool]]):
+        for answer_text, is_correct in answers:
+            self.writer.add(Answer(
+                question_id=question.pk,
+                answer_text=answer_text,
+                is_correct=is_correct))
+
+    def close(self):
+        self.writer.close()
+        removed = [question.pk for key, question in self.questions.items()
+            if key not in self.seen_keys]
+        Question.objects.filter(pk__in=removed).delete()
+        self.stats.deleted += len(removed)
+
+
+class TestStepSync:
+
+    def __init__(self, stats: SyncStats):
+        self.stats = stats
+        self.writer = BatchWriter(TestStep)
+        self.topics = TopicWriter()
+        self.test_steps = {
+            (test_step.topic_id, test_step.test_question): test_step
+            for test_step in TestStep.objects.all()}
+        self.seen_keys: set[tuple[str, str]] = set()
+
+    def apply(self, entry: dict):
+        key = (entry['topic'], entry['q'])
+        self.seen_keys.add(key)
+        test_step = self.test_steps.get(key)
+        if not test_step:
+            self.writer.add(TestStep(
+                test_question=entry['q'],
+                topic_id=self.topics.add(entry['topic']),
+                test_answer=entry['+']))
+            self.stats.inserted += 1
+        elif test_step.test_answer != entry['+']:
+            test_step.test_answer = entry['+']
+            test_step.save(update_fields=['test_answer'])
+            self.stats.updated += 1
+        else:
+            self.stats.unchanged += 1
+
+    def close(self):
+        self.writer.close()
+        removed = [test_step.pk for key, test_step in self.test_steps.items()
+            if key not in self.seen_keys]
+        TestStep.objects.filter(pk__in=removed).delete()
+        self.stats.deleted += len(removed)
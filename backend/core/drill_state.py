@@ -0,0 +1,96 @@
+"""Per-person drill state kept in the cache.
+
+The drilled topic, the challenge on screen with its disclosure and the
+challenge prepared next change on every click and matter only for the
+next one, so they live in the cache set by CACHES rather than in the
+person row. The row keeps a checkpoint of the state: written when the
+topic changes and every DRILL_STATE_CHECKPOINT_STEPS steps, read when
+the cache has no state for the person. A drill resumes at the
+checkpointed challenge then.
+"""
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.app.models import Person, Question
+
+
+@dataclass
+class DrillState:
+    topic: Optional[str] = None
+    # If user answered challenge wrongly or issued the "I don't know"
+    # command, disclose answers until the "next challenge" command.
+    disclose_answers: Optional[bool] = None
+    # the challenge on screen: question and comma separated answer ids
+    current_question_id: Optional[int] = None
+    current_answers: str = ""
+    # the challenge prepared to be shown next
+    next_question_id: Optional[int] = None
+    next_answers: str = ""
+    # steps saved to the cache only, since the last checkpoint
+    unsaved_steps: int = 0
+    # Topic questions the person was never asked, read from DB for the
+    # content of catalog_stamp and not checkpointed; None until read.
+    never_asked: Optional[list[int]] = None
+    catalog_stamp: str = ""
+
+
+def cache_key(person_id: int) -> str:
+    return f"drill-state:{person_id}"
+
+
+def load(person: Person) -> DrillState:
+    saved = cache.get(cache_key(person.pk))
+    if saved is not None:
+        try:
+            return DrillState(**saved)
+        except TypeError:
+            pass  # written by another version of the app
+    return DrillState(
+        topic=person.challenge_topic,
+        disclose_answers=person.disclose_answers,
+        current_question_id=person.current_question_id,
+        current_answers=person.current_answers,
+        next_question_id=person.next_question_id,
+        next_answers=person.next_answers)
+
+
+def save(person: Person, state: DrillState, checkpoint: bool = False):
+    state.unsaved_steps += 1
+    if checkpoint or \
+            state.unsaved_steps >= settings.DRILL_STATE_CHECKPOINT_STEPS:
+        write_checkpoint(person, state)
+        state.unsaved_steps = 0
+    cache.set(cache_key(person.pk), asdict(state), timeout=None)
+
+
+def forget(person_id: int):
+    # the next load reads the checkpoint
+    cache.delete(cache_key(person_id))
+
+
+def write_checkpoint(person: Person, state: DrillState):
+    # questions removed by a content reload since they were shown
+    question_ids = {state.current_question_id, state.next_question_id}
+    existing_ids = set(Question.objects.filter(
+        pk__in=question_ids - {None}).values_list('pk', flat=True))
+
+    person.challenge_topic = state.topic
+    person.disclose_answers = state.disclose_answers
+    if state.current_question_id in existing_ids:
+        person.current_question_id = state.current_question_id
+        person.current_answers = state.current_answers
+    else:
+        person.current_question_id, person.current_answers = None, ""
+    if state.next_question_id in existing_ids:
+        person.next_question_id = state.next_question_id
+        person.next_answers = state.next_answers
+    else:
+        person.next_question_id, person.next_answers = None, ""
+    person.save(update_fields=[
+        'challenge_topic', 'disclose_answers',
+        'current_question', 'current_answers',
+        'next_question', 'next_answers'])
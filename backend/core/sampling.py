@@ -0,0 +1,33 @@
+"""Choice of answers shown on screen with a drill question"""
+from __future__ import annotations
+import random
+from typing import Sequence
+
+from django.conf import settings
+
+
+ANSWERS_ON_SCREEN = 4
+
+
+def sample_answer_ids(correct_ids: Sequence[int], wrong_ids: Sequence[int],
+        answers_on_screen: int = ANSWERS_ON_SCREEN,
+        rng: random.Random = random) -> list[int]:  # type: ignore
+    """Choose answer ids to show, in random order.
+
+    At least one correct answer is shown when the question has one, except
+    for a share of NO_CORRECT_ANSWER_RATE draws made of wrong answers only,
+    so that the "no correct answer" button stays meaningful. A question
+    with fewer answers than fit the screen shows all its answers.
+    """
+    no_correct_draw = len(wrong_ids) >= answers_on_screen \
+        and rng.random() < settings.NO_CORRECT_ANSWER_RATE
+    if not correct_ids or no_correct_draw:
+        sample = rng.sample(wrong_ids, min(answers_on_screen, len(wrong_ids)))
+    else:
+        correct_id = rng.choice(correct_ids)
+        other_ids = [answer_id for answer_id
+            in (*correct_ids, *wrong_ids) if answer_id != correct_id]
+        sample = [correct_id] + rng.sample(
+            other_ids, min(answers_on_screen - 1, len(other_ids)))
+    rng.shuffle(sample)
+    return sample
@@ -0,0 +1,156 @@
+"""Policies deciding which question of a topic a person drills next.
+
+The policy is chosen with the DRILL_SCHEDULER setting: a name from
+SCHEDULERS or a dotted path to a Scheduler subclass.
+
+ChallengeSummary keeps rows only for questions a person was asked, so
+the questions never asked are read once by find_never_asked and then
+kept up to date by the caller, see backend.core.drill_state.
+"""
+from __future__ import annotations
+from datetime import timedelta
+import random
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from backend.app.models import ChallengeSummary, Person
+from backend.core import asked_counts
+
+
+# Rows read in index order to pick at random among equally ranked ones
+TIE_ROWS = 16
+
+
+class Scheduler:
+    """Picks the next question and learns from the person's answers"""
+
+    def pick_question(self, person: Person, topic: str,
+            topic_questions: tuple[int, ...], never_asked: list[int]) -> int:
+        raise NotImplementedError
+
+    def record_answer(self, person: Person, question_id: int,
+            is_correct: bool):
+        pass
+
+
+class LeastAskedScheduler(Scheduler):
+    """Asks the question which was asked less number of times"""
+
+    def pick_question(self, person: Person, topic: str,
+            topic_questions: tuple[int, ...], never_asked: list[int]) -> int:
+        if never_asked:
+            return random.choice(never_asked)
+        topic_challenges = ChallengeSummary.objects.filter(
+            person=person, topic=topic)
+        # Counts in DB miss the increments still in the write-behind
+        # buffer. Only the pending rows may rank lower than in DB, so
+        # the least asked row is among len(pending) more rows.
+        pending = asked_counts.pending_counts(person.pk)
+        rows = first_rows(topic_challenges, 'asked_count',
+            TIE_ROWS + len(pending))
+        for row in rows:
+            row.asked_count += pending.get(row.question_id, 0)
+        rows.sort(key=lambda row: row.asked_count)
+        # random among equally asked questions
+        least_asked = pick_tied(rows, lambda row: row.asked_count)
+        if not least_asked:
+            # rows removed since the never asked questions were read
+            return random.choice(topic_questions)
+        return least_asked.question_id
+
+
+class SuperMemoScheduler(Scheduler):
+    """Spaced repetition by the SM-2 algorithm.
+
+    Each (person, question) row keeps its ease, interval and due time.
+    A right answer moves the due time further away with every repetition,
+    a wrong one makes the question due again shortly and lowers its ease.
+    """
+    relearn_interval = 10 / (24 * 60)  # days, that is 10 minutes
+    first_interval = 1
+    second_interval = 6
+    min_ease = 1.3
+
+    def pick_question(self, person: Person, topic: str,
+            topic_questions: tuple[int, ...], never_asked: list[int]) -> int:
+        topic_challenges = ChallengeSummary.objects.filter(
+            person=person, topic=topic)
+        # Asked but not answered questions have no due time yet,
+        # they are repeated first.
+        rows = first_rows(topic_challenges, F('due').asc(nulls_first=True))
+        earliest_due = pick_tied(rows, lambda row: row.due)
+        now = timezone.now()
+        if earliest_due and (earliest_due.due or now) <= now:
+            return earliest_due.question_id
+        # Nothing to repeat yet: learn a new question if one is left,
+        # otherwise repeat the question due next ahead of time.
+        if never_asked:
+            return random.choice(never_asked)
+        if not earliest_due:
+            return random.choice(topic_questions)
+        return earliest_due.question_id
+
+    def record_answer(self, person: Person, question_id: int,
+            is_correct: bool):
+        # locked till the transaction of the drill action ends
+        record = ChallengeSummary.objects.select_for_update().filter(
+            person=person, question_id=question_id).first()
+        if not record:
+            return
+
+        # SM-2 answer quality: 4 for a right answer, 1 for a wrong one
+        quality = 4 if is_correct else 1
+        record.ease = max(self.min_ease, record.ease
+            + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        if not is_correct:
+            record.repetitions = 0
+            record.interval = self.relearn_interval
+        elif record.repetitions == 0:
+            record.repetitions, record.interval = 1, self.first_interval
+        elif record.repetitions == 1:
+            record.repetitions, record.interval = 2, self.second_interval
+        else:
+            record.repetitions += 1
+            record.interval = record.interval * record.ease
+        record.due = timezone.now() + timedelta(days=record.interval)
+        record.save(update_fields=['ease', 'repetitions', 'interval', 'due'])
+
+
+def first_rows(topic_challenges: QuerySet, order: Any,
+        limit: int = TIE_ROWS) -> list:
+    """First rows in the indexed order"""
+    return list(topic_challenges.order_by(order)
+        .only('question_id', 'asked_count', 'due')[:limit])
+
+
+def pick_tied(rows: list, rank: Callable[[Any], Any]) -> Optional[Any]:
+    # random among the rows ranked as the first one of the sorted rows
+    if not rows:
+        return None
+    first_rank = rank(rows[0])
+    return random.choice([row for row in rows if rank(row) == first_rank])
+
+
+def find_never_asked(person: Person, topic: str,
+        topic_questions: tuple[int, ...]) -> list[int]:
+    # questions without a row were never asked
+    asked_questions = set(ChallengeSummary.objects.filter(
+        person=person, topic=topic).values_list('question_id', flat=True))
+    return [question_id for question_id in topic_questions
+        if question_id not in asked_questions]
+
+
+SCHEDULERS = {
+    'least_asked': LeastAskedScheduler,
+    'sm2': SuperMemoScheduler,
+}
+
+
+def get_scheduler() -> Scheduler:
+    name = settings.DRILL_SCHEDULER
+    scheduler_class = SCHEDULERS.get(name) or import_string(name)
+    return scheduler_class()
@@ -0,0 +1,263 @@
+"""Drill content catalog stored in one memory-mapped file.
+
+The build_catalog command writes the catalog into a file which workers
+map into memory instead of loading content from DB. Pages of the file
+are shared by all worker processes, and records are decoded only when
+asked for, so opening takes the same time for any catalog size.
+
+File layout, all numbers are little-endian unsigned 32-bit integers:
+    header
+    question records, grouped by topic and ordered by id in a topic
+    answer records, grouped by question in the order of questions
+    topic records: topic name and range of its question records
+    test topic records: topic name and range of its test step ids
+    (id, record number) pairs for questions, ordered by id
+    (id, record number) pairs for answers, ordered by id
+    test step ids
+    string table of UTF-8 texts referred to by (offset, length)
+"""
+from __future__ import annotations
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import Optional
+
+from backend.app.models import Answer, Question
+
+
+MAGIC = b"SDCATLG\0"
+FORMAT_VERSION = 1
+
+# magic, format version, catalog stamp, then counts of questions,
+# answers, topics, test topics and test steps
+HEADER = struct.Struct("<8sI32sIIIII")
+# id, topic record, text, explanation, first answer record, answer count
+QUESTION = struct.Struct("<IIIIIIII")
+# id, question record, text, is correct
+ANSWER = struct.Struct("<IIIIB3x")
+# name, first record, record count
+TOPIC = struct.Struct("<IIII")
+ID_INDEX = struct.Struct("<II")
+TEST_STEP_ID = struct.Struct("<I")
+
+
+class StringTable:
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def add(self, text: str) -> tuple[int, int]:
+        encoded = text.encode("utf-8")
+        offset = len(self.data)
+        self.data += encoded
+        return offset, len(encoded)
+
+
+def write_snapshot(catalog, path: Path):
+    """Write the catalog to a file replacing the old one atomically"""
+    strings = StringTable()
+    topics = sorted(catalog.topic_questions)
+    test_topics = sorted(catalog.topic_test_steps)
+
+    questions, answers = bytearray(), bytearray()
+    # (id, record number) pairs, sorted by id when written
+    question_index: list[tuple[int, int]] = []
+    answer_index: list[tuple[int, int]] = []
+    topic_records = bytearray()
+    for topic_number, topic in enumerate(topics):
+        question_ids = catalog.topic_questions[topic]
+        topic_records += TOPIC.pack(
+            *strings.add(topic), len(question_index), len(question_ids))
+        for question_id in question_ids:
+            question = catalog.questions[question_id]
+            answer_ids = catalog.question_answers[question_id]
+            question_number = len(question_index)
+            question_index.append((question_id, question_number))
+            questions += QUESTION.pack(
+                question_id, topic_number,
+                *strings.add(question.question_text),
+                *strings.add(question.explanation_text),
+                len(answer_index), len(answer_ids))
+            for answer_id in answer_ids:
+                answer = catalog.answers[answer_id]
+                answer_index.append((answer_id, len(answer_index)))
+                answers += ANSWER.pack(answer_id, question_number,
+                    *strings.add(answer.answer_text), answer.is_correct)
+
+    test_topic_records, test_step_ids = bytearray(), bytearray()
+    test_step_count = 0
+    for test_topic in test_topics:
+        ids = catalog.topic_test_steps[test_topic]
+        test_topic_records += TOPIC.pack(
+            *strings.add(test_topic), test_step_count, len(ids))
+        for test_step_id in ids:
+            test_step_ids += TEST_STEP_ID.pack(test_step_id)
+        test_step_count += len(ids)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, catalog.stamp.encode(),
+        len(question_index), len(answer_index), len(topics),
+        len(test_topics), test_step_count)
+    sections = [header, questions, answers, topic_records,
+        test_topic_records,
+        *(b"".join(ID_INDEX.pack(*pair) for pair in sorted(index))
+            for index in (question_index, answer_index)),
+        test_step_ids, strings.data]
+
+    temporary_path = path.with_name(path.name + ".tmp")
+    with open(temporary_path, "wb") as file:
+        for section in sections:
+            file.write(section)
+    # workers which mapped the old file keep reading it until they reopen
+    os.replace(temporary_path, path)
+
+
+class SnapshotCatalog:
+    """Read-only catalog backed by a memory-mapped snapshot file"""
+
+    def __init__(self, buffer: mmap.mmap):
+        self.buffer = buffer
+        (magic, format_version, stamp, self.question_count,
+            self.answer_count, topic_count, test_topic_count,
+            test_step_count) = HEADER.unpack_from(buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("Not a catalog snapshot of known format")
+        self.stamp = stamp.rstrip(b"\0").decode()
+
+        offset = HEADER.size
+        self.questions_at = offset
+        offset += self.question_count * QUESTION.size
+        self.answers_at = offset
+        offset += self.answer_count * ANSWER.size
+        topics_at = offset
+        offset += topic_count * TOPIC.size
+        test_topics_at = offset
+        offset += test_topic_count * TOPIC.size
+        self.question_index_at = offset
+        offset += self.question_count * ID_INDEX.size
+        self.answer_index_at = offset
+        offset += self.answer_count * ID_INDEX.size
+        self.test_step_ids_at = offset
+        offset += test_step_count * TEST_STEP_ID.size
+        self.strings_at = offset
+
+        # Topics are few, so their names are decoded once.
+        self.topics = self._read_topics(topics_at, topic_count)
+        self.topic_names = list(self.topics)
+        self.test_topics = self._read_topics(
+            test_topics_at, test_topic_count)
+
+    @staticmethod
+    def open(path: Path) -> SnapshotCatalog:
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return SnapshotCatalog(buffer)
+
+    def _read_topics(self, offset: int, count: int) -> dict[str, range]:
+        topics = {}
+        for number in range(count):
+            name_offset, name_length, first, record_count = \
+                TOPIC.unpack_from(self.buffer, offset + number * TOPIC.size)
+            name = self._read_string(name_offset, name_length)
+            topics[name] = range(first, first + record_count)
+        return topics
+
+    def _read_string(self, offset: int, length: int) -> str:
+        start = self.strings_at + offset
+        return self.buffer[start:start + length].decode("utf-8")
+
+    def _find(self, index_at: int, count: int, wanted_id: int
+            ) -> Optional[int]:
+        # binary search of a record number by id
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            found_id, record_number = ID_INDEX.unpack_from(
+                self.buffer, index_at + middle * ID_INDEX.size)
+            if found_id < wanted_id:
+                low = middle + 1
+            elif found_id > wanted_id:
+                high = middle
+            else:
+                return record_number
+        return None
+
+    def _read_question(self, record_number: int) -> tuple:
+        return QUESTION.unpack_from(
+            self.buffer, self.questions_at + record_number * QUESTION.size)
+
+    def _read_answer(self, record_number: int) -> tuple:
+        return ANSWER.unpack_from(
+            self.buffer, self.answers_at + record_number * ANSWER.size)
+
+    def _make_question(self, record_number: int) -> Question:
+        (question_id, topic_number, text_offset, text_length,
+            explanation_offset, explanation_length, *_) = \
+            self._read_question(record_number)
+        return Question(
+            pk=question_id,
+            question_text=self._read_string(text_offset, text_length),
+            explanation_text=self._read_string(
+                explanation_offset, explanation_length),
+            topic_id=self.topic_names[topic_number])
+
+    def _make_answer(self, record_number: int,
+            question: Optional[Question] = None) -> Answer:
+        answer_id, question_number, text_offset, text_length, is_correct = \
+            self._read_answer(record_number)
+        answer = Answer(
+            pk=answer_id,
+            answer_text=self._read_string(text_offset, text_length),
+            is_correct=bool(is_correct))
+        answer.question = question or self._make_question(question_number)
+        return answer
+
+    def get_question(self, question_id: int) -> Optional[Question]:
+        record_number = self._find(
+            self.question_index_at, self.question_count, question_id)
+        if record_number is None:
+            return None
+        return self._make_question(record_number)
+
+    def get_answer(self, answer_id: int) -> Optional[Answer]:
+        record_number = self._find(
+            self.answer_index_at, self.answer_count, answer_id)
+        if record_number is None:
+            return None
+        return self._make_answer(record_number)
+
+    def _answer_records(self, question_id: int) -> range:
+        record_number = self._find(
+            self.question_index_at, self.question_count, question_id)
+        if record_number is None:
+            return range(0)
+        *_, first_answer, answer_count = self._read_question(record_number)
+        return range(first_answer, first_answer + answer_count)
+
+    def get_answers(self, question_id: int) -> list[Answer]:
+        question = self.get_question(question_id)
+        return [self._make_answer(record_number, question)
+            for record_number in self._answer_records(question_id)]
+
+    def get_answer_ids(self, question_id: int) -> tuple[
+            tuple[int, ...], tuple[int, ...]]:
+        """Ids of correct and of wrong answers to the question"""
+        correct_ids: list[int] = []
+        wrong_ids: list[int] = []
+        for record_number in self._answer_records(question_id):
+            answer_id, *_, is_correct = self._read_answer(record_number)
+            (correct_ids if is_correct else wrong_ids).append(answer_id)
+        return tuple(correct_ids), tuple(wrong_ids)
+
+    def get_topic_question_ids(self, topic: str) -> tuple[int, ...]:
+        return tuple(self._read_question(record_number)[0]
+            for record_number in self.topics.get(topic, ()))
+
+    def get_test_step_ids(self, topic: str) -> tuple[int, ...]:
+        return tuple(TEST_STEP_ID.unpack_from(self.buffer,
+                self.test_step_ids_at + number * TEST_STEP_ID.size)[0]
+            for number in self.test_topics.get(topic, ()))
+
+    def count_test_steps(self) -> dict[str, int]:
+        return {topic: len(records)
+            for topic, records in self.test_topics.items()}
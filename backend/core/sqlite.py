@@ -0,0 +1,80 @@
+"""SQLite tuning for single-node deployments.
+
+Every new SQLite connection switches the database to write-ahead
+logging, so that readers are not blocked by a writer, and gets the busy
+timeout and memory map size from settings.
+
+A transaction which read the database and then writes to it fails at
+once with "database is locked" if another connection wrote in between,
+as waiting would not help it. Such transactions are run again, or take
+the write lock when they begin instead.
+"""
+from contextlib import contextmanager
+import random
+import time
+from typing import Callable, Iterator, TypeVar
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.backends.signals import connection_created
+
+
+T = TypeVar('T')
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode = WAL")
+        # with WAL, a commit is durable after the next checkpoint
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute("PRAGMA busy_timeout = %d"
+            % (settings.SQLITE_BUSY_TIMEOUT * 1000))
+        cursor.execute("PRAGMA mmap_size = %d" % settings.SQLITE_MMAP_SIZE)
+
+
+def connect_signals():
+    connection_created.connect(configure_connection)
+
+
+@contextmanager
+def write_transaction() -> Iterator[None]:
+    """Atomic block which takes the SQLite write lock when it begins.
+
+    SQLite has no row locks, so this is how a transaction makes parallel
+    writers wait for it without writing a row. Other databases and
+    blocks nested in a transaction get a plain atomic block.
+    """
+    # read by the backend.sqlite3 backend on BEGIN
+    connection.begin_immediate = True
+    try:
+        with transaction.atomic():
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
+
+
+def retry_when_locked(transaction: Callable[[], T],
+        on_retry: Callable[[], None] = None) -> T:
+    """Run a transaction again while SQLite reports the database locked.
+
+    Only a whole transaction can be run again, so inside an outer one
+    the error is raised for the outer one to handle. on_retry is to drop
+    state the failed run left in memory.
+    """
+    attempt = 0
+    while True:
+        try:
+            return transaction()
+        except OperationalError as ex:
+            if "database is locked" not in str(ex) \
+                    or connection.in_atomic_block \
+                    or attempt >= settings.SQLITE_LOCK_RETRIES:
+                raise
+        attempt += 1
+        # back off randomly so that parallel writers do not meet again
+        time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+        if on_retry:
+            on_retry()
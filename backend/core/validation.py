@@ -0,0 +1,126 @@
+"""Checks of fixture files made before any of them touches the DB.
+
+Files are checked in a process pool, so this module does not import
+models and can run in a worker without Django set up.
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import json
+from pathlib import Path
+from typing import IO, Iterator, Optional
+
+from backend.core.sampling import ANSWERS_ON_SCREEN
+
+
+TEST_TOPICS = ("start", "final")
+READ_SIZE = 64 * 1024
+
+
+def get_fixture_kind(file_name: str) -> Optional[str]:
+    if "test" in file_name:
+        return "test"
+    if "challenges" in file_name:
+        return "challenges"
+    return None
+
+
+def validate_fixtures(paths: list) -> list[str]:
+    """All errors found in the fixture files"""
+    file_names = [str(path) for path in paths]
+    if len(file_names) < 2:
+        return [error for file_name in file_names
+            for error in validate_fixture(file_name)]
+    with ProcessPoolExecutor() as executor:
+        return [error for errors in executor.map(validate_fixture, file_names)
+            for error in errors]
+
+
+def validate_fixture(file_name: str) -> list[str]:
+    name = Path(file_name).name
+    kind = get_fixture_kind(name)
+    if not kind:
+        return [f"{name}: name tells neither test nor challenges fixture"]
+
+    check_entry = check_test_step if kind == "test" else check_challenge
+    errors = []
+    # read as a stream like the load, not the whole file at once
+    try:
+        with open(file_name, encoding="utf-8") as stream:
+            for number, entry in enumerate(
+                    iter_json_array(stream), start=1):
+                if not isinstance(entry, dict):
+                    errors.append(
+                        f"{name}, entry {number}: must be a JSON object")
+                    continue
+                errors += [f"{name}, entry {number}: {error}"
+                    for error in check_entry(entry)]
+    except (OSError, ValueError) as ex:
+        errors.append(f"{name}: {ex}")
+    return errors
+
+
+def iter_json_array(stream: IO[str]) -> Iterator[dict]:
+    """Yield items of a JSON array without reading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    array_started = False
+    file_ended = False
+
+    while True:
+        # skip whitespace and separators between items
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if not array_started and position < len(buffer):
+            if buffer[position] != "[":
+                raise ValueError("Fixture must be a JSON array")
+            array_started = True
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            # a number may go on in the next chunk
+            item_read = end < len(buffer) or file_ended
+        except json.JSONDecodeError:
+            if file_ended:
+                raise
+            item_read = False
+        if not item_read:
+            chunk = stream.read(READ_SIZE)
+            file_ended = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def check_test_step(entry: dict) -> list[str]:
+    errors = check_texts(entry, 'topic', 'q', '+')
+    if entry.get('topic') not in TEST_TOPICS:
+        errors.append(f"topic must be one of {', '.join(TEST_TOPICS)}")
+    return errors
+
+
+def check_challenge(entry: dict) -> list[str]:
+    errors = check_texts(entry, 'topic', 'q', 'th')
+    answer_count = 0
+    for key in ('+', '-'):
+        # there can be no correct answer not to prompt the user
+        answers = entry.get(key, [] if key == '+' else None)
+        if not isinstance(answers, list) or not all(
+                isinstance(answer, str) for answer in answers):
+            errors.append(f"'{key}' must be a list of texts")
+            continue
+        answer_count += len(answers)
+    if not errors and answer_count < ANSWERS_ON_SCREEN:
+        errors.append(f"{answer_count} answers given, "
+            f"{ANSWERS_ON_SCREEN} are shown on screen")
+    return errors
+
+
+def check_texts(entry: dict, *keys: str) -> list[str]:
+    return [f"'{key}' must be a non-empty text" for key in keys
+        if not isinstance(entry.get(key), str) or not entry[key].strip()]
@@ -1,17 +1,41 @@
-from itertools import cycle
+from __future__ import annotations
 import os
-import random
 from uuid import uuid4
 from dataclasses import dataclass
+import functools
+from typing import Optional
 
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.shortcuts import redirect
-from django.urls import reverse
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
 
-from backend.app.models import Person, Invite, TestStep, Question, Answer
-from backend.app.models import ChallengeSummary, CurrentAnswers, TestSummary
-from backend.app import views
+from backend.app.models import Person, Invite, Question, Answer
+from backend.app.models import ChallengeSummary, TestSummary
+from backend.core import asked_counts, drill_state
+from backend.core.catalog import get_catalog
+from backend.core.drill_state import DrillState
+from backend.core.sampling import sample_answer_ids
+from backend.core.scheduler import find_never_asked, get_scheduler
+from backend.core.sqlite import retry_when_locked, write_transaction
+
+
+# Visitor actions return plain results below instead of HTTP responses,
+# so they can run without a request; views turn them into pages.
+
+@dataclass
+class Redirect:
+    url_name: str
+
+
+@dataclass
+class HomepageInfo:
+    button_test_info: str
+
+
+@dataclass
+class InviteList:
+    invites: list[Invite]
 
 
 @dataclass
@@ -21,6 +45,94 @@ class TestExplanationPage:
     btn_text: str
 
 
+@dataclass
+class TestStepPage:
+    test_step: TestSummary
+    # a number of the step in the test, e.g. "3 of 10"
+    countdown: str
+
+
+@dataclass
+class TestScore:
+    start_score: Optional[str]
+    final_score: Optional[str]
+
+
+@dataclass
+class ChallengePage:
+    challenge: Challenge
+    is_failure: Optional[bool] = None
+    with_error: Optional[str] = None
+
+
+@dataclass
+class TestProgress:
+    """Counts of test steps and visitor's test answers made at one moment"""
+    # test step count per topic: {"start": 10, "final": 10}
+    question_counts: dict[str, int]
+    # visitor's test answer count per (topic, is_correct)
+    answer_counts: dict[tuple[str, Optional[bool]], int]
+
+    @staticmethod
+    def count(person: Person) -> TestProgress:
+        question_counts = get_catalog().count_test_steps()
+        answer_counts = {
+            (row['topic'], row['is_correct']): row['count']
+            for row in TestSummary.objects.filter(person=person)
+                .values('topic', 'is_correct')
+                .annotate(count=Count('id')).order_by()
+        }
+        return TestProgress(question_counts, answer_counts)
+
+    def question_count(self, topic: str = None) -> int:
+        if topic is None:
+            return sum(self.question_counts.values())
+        return self.question_counts.get(topic, 0)
+
+    def user_count(self, topic: str = None, is_correct=...) -> int:
+        # "..." stands for any answer state, as None means "not answered"
+        return sum(count for (key_topic, key_is_correct), count
+            in self.answer_counts.items()
+            if topic in (None, key_topic)
+            and is_correct in (..., key_is_correct))
+
+    def unanswered_count(self) -> int:
+        return self.user_count(is_correct=None)
+
+
+def locks_person(action):
+    """Runs a drill action in a transaction holding the person row lock.
+
+    Drill actions rewrite the drill state and challenge records of the
+    person, so parallel actions of one person (e.g. a double click) run
+    one after another, each seeing what the previous one wrote.
+    """
+    @functools.wraps(action)
+    def locked(visitor: Visitor, *args, **kwargs):
+        def run():
+            try:
+                with write_transaction():
+                    visitor.person = lock_person(visitor.person.pk)
+                    visitor._drill_state = None
+                    return action(visitor, *args, **kwargs)
+            except Exception:
+                # also drops the state cached before the rollback
+                visitor.forget_changes()
+                raise
+        return retry_when_locked(run)
+    return locked
+
+
+def lock_person(person_id: int) -> Person:
+    # read again once locked, as a parallel action may have changed it
+    persons = Person.objects.filter(pk=person_id)
+    if connection.features.has_select_for_update:
+        return persons.select_for_update().get()
+    # SQLite has no row locks, the write lock of the whole DB was taken
+    # when the transaction began
+    return persons.get()
+
+
 class Visitor:
     """Represents web app visitor and their actions"""
 
@@ -29,10 +141,41 @@ class Visitor:
             self.person = Person.objects.get(user=user)
         except Person.DoesNotExist as ex:
             raise LookupError(f"No person for {user} in DB") from ex
+        # Visitor lives for one request, so the drill counter is summed
+        # in DB once and then reused by every countdown check.
+        self._challenge_count: Optional[int] = None
+        self._test_progress: Optional[TestProgress] = None
+        self._drill_state: Optional[DrillState] = None
+        self._drill_state_saved = False
+
+
+    def forget_changes(self):
+        # counts of a rolled back transaction, the person is read again
+        self._challenge_count = None
+        self._test_progress = None
+        # The cache is not rolled back with the transaction, so the
+        # state is read from the checkpoint in the person row instead.
+        if self._drill_state_saved:
+            drill_state.forget(self.person.pk)
+        self._drill_state = None
+        self._drill_state_saved = False
+
+
+    def get_drill_state(self) -> DrillState:
+        if self._drill_state is None:
+            self._drill_state = drill_state.load(self.person)
+        return self._drill_state
+
+
+    def save_drill_state(self, checkpoint: bool = False):
+        drill_state.save(self.person, self.get_drill_state(), checkpoint)
+        self._drill_state_saved = True
 
 
     @staticmethod
-    def register(username: str, password: str, invite: str):
+    def register(username: str, password: str,
+            invite: str) -> Optional[Person]:
+        # None tells that the invite code is invalid
         try:
             code_to_check = Invite.objects.get(code=invite)
             if not code_to_check.used_by:
@@ -41,38 +184,35 @@ class Visitor:
                 person = Person.objects.create(user=user)
                 code_to_check.used_by = user
                 code_to_check.save()
-                views.connect_person_to_session(person)
-                return redirect("/")
+                return person
             else:
-                return views.render_register_visitor(
-                    empty_field=False, invalid_code=True)
+                return None
         except Invite.DoesNotExist:
-            return views.render_register_visitor(
-                    empty_field=False, invalid_code=True)
+            return None
 
 
     @staticmethod
-    def login(username: str, password: str):
+    def login(username: str, password: str) -> Optional[Person]:
+        # None tells that the credentials are invalid
         user = authenticate(username=username, password=password)
         if not user:
-            return views.render_login_visitor(invalid_credentials=True)
+            return None
         person = Person.objects.get(user=user)
         assert person
-        views.connect_person_to_session(person)
-        return redirect("/")
+        return person
 
 
     def show_invites(self):
         if not self.person.user.is_staff:
-            return redirect(reverse("login-visitor"))
+            return Redirect("login-visitor")
 
         invites = Invite.objects.all()
-        return views.render_invites(invites) # type: ignore
+        return InviteList(invites) # type: ignore
 
 
     def add_invite(self, comment: str):
         if not self.person.user.is_staff:
-            return redirect(reverse("login-visitor"))
+            return Redirect("login-visitor")
 
         Invite.objects.create(
             inviter=self.person.user,
@@ -82,11 +222,6 @@ class Visitor:
         return self.show_invites()
 
 
-    def logout(self):
-        views.disconnect_person_from_session(self.person)
-        return redirect("/")
-
-
     def get_button_test_info(self):
         user_challenges = self.count_user_challenges()
         countdown = self.get_countdown_to_final_test()
@@ -99,7 +234,7 @@ class Visitor:
             button_test_info = "View test scores"
         else:
             button_test_info = "Take the final test"
-        return views.render_homepage(button_test_info)
+        return HomepageInfo(button_test_info)
 
 
     def show_test_explanation(self):
@@ -119,48 +254,52 @@ class Visitor:
 
 
     def _offer_test_before_start(self):
-        return views.render_explain_test(TestExplanationPage(
+        return TestExplanationPage(
             foreword="We recommend that you take our test before you " +
                     "start Python drills.",
             url_name_to_go_to="test",
             btn_text="Take the start test",
-        ))
+        )
 
 
     def _tell_countdown_to_final_test(_, countdown, start_test_score):
-        return views.render_explain_test(TestExplanationPage(
+        return TestExplanationPage(
             foreword=f"Your start test score: {start_test_score}.\n" +
                     f"After doing {countdown} drills you will be able " +
                     "to take the test again.\nGo and practice!",
             url_name_to_go_to="select-topic",
             btn_text="Go and practice!",
-        ))
+        )
 
 
     def _tell_results_of_two_tests(_, start_test_score, final_test_score):
-        return views.render_explain_test(TestExplanationPage(
+        return TestExplanationPage(
             foreword="Congratulations!\n" +
                     "You have completed all the tests.\n" +
                     f"Your start test score: {start_test_score}.\n" +
                     f"Your final test score: {final_test_score}.",
             url_name_to_go_to="select-topic",
             btn_text="Go and practice!",
-        ))
+        )
 
 
     def _offer_final_test(self):
-        return views.render_explain_test(TestExplanationPage(
+        return TestExplanationPage(
             foreword="You have done a lot of drilling.\n" +
                     "It is time to take your final test.",
             url_name_to_go_to = "test",
             btn_text = "Take the final test",
-        ))
+        )
 
 
     def count_user_challenges(self) -> int:
-        challenges = ChallengeSummary.objects.filter(person=self.person)
-        challenges = [challenge.asked_count for challenge in challenges]
-        return sum(challenges)
+        if self._challenge_count is None:
+            total = ChallengeSummary.objects.filter(
+                person=self.person).aggregate(total=Sum('asked_count'))
+            pending = asked_counts.pending_counts(self.person.pk)
+            self._challenge_count = (total['total'] or 0) \
+                + sum(pending.values())
+        return self._challenge_count
 
 
     def get_target_repetitions_count(self):
@@ -173,14 +312,21 @@ class Visitor:
         return target_challenges - user_challenges
 
 
+    def get_test_progress(self) -> TestProgress:
+        # Counted once per request and dropped whenever test steps
+        # of the visitor are written.
+        if self._test_progress is None:
+            self._test_progress = TestProgress.count(self.person)
+        return self._test_progress
+
+
     def count_test_score(self) -> tuple:
-        start_question_count = len(TestStep.objects.filter(topic="start"))
-        final_question_count = len(TestStep.objects.filter(topic="final"))
+        progress = self.get_test_progress()
+        start_question_count = progress.question_count("start")
+        final_question_count = progress.question_count("final")
 
-        correct_answers_start = len(TestSummary.objects.filter(
-            person=self.person, is_correct=True, topic="start"))
-        correct_answers_final = len(TestSummary.objects.filter(
-            person=self.person, is_correct=True, topic="final"))
+        correct_answers_start = progress.user_count("start", is_correct=True)
+        correct_answers_final = progress.user_count("final", is_correct=True)
 
         start_score = f"{correct_answers_start} of {start_question_count}"
         final_score = f"{correct_answers_final} of {final_question_count}"
@@ -194,27 +340,23 @@ class Visitor:
 
 
     def visitor_did_start_test(self) -> bool:
-        start_question_count = len(TestStep.objects.filter(topic="start"))
-        start_question_user_count = len(TestSummary.objects.filter(
-            person=self.person, topic="start"))
+        progress = self.get_test_progress()
+        start_question_count = progress.question_count("start")
+        start_question_user_count = progress.user_count("start")
         test_was_started = start_question_count == start_question_user_count
 
-        unanswered_questions = len(TestSummary.objects.filter(
-            person=self.person, is_correct=None))
-        all_answered = unanswered_questions == 0
+        all_answered = progress.unanswered_count() == 0
 
         return test_was_started and all_answered
 
 
     def visitor_did_final_test(self) -> bool:
-        test_question_count = len(TestStep.objects.all())
-        test_question_user_count = len(
-            TestSummary.objects.filter(person=self.person))
+        progress = self.get_test_progress()
+        test_question_count = progress.question_count()
+        test_question_user_count = progress.user_count()
         tests_were_started = test_question_count == test_question_user_count
 
-        unanswered_questions = len(TestSummary.objects.filter(
-            person=self.person, is_correct=None))
-        all_answered = unanswered_questions == 0
+        all_answered = progress.unanswered_count() == 0
 
         return tests_were_started and all_answered
 
@@ -223,22 +365,21 @@ class Visitor:
         test_step: TestSummary = self.get_test_summary_step()
         countdown: str = self.get_test_steps_countdown()
         if not test_step:
-            test_score = self.count_test_score()
-            return views.render_test_score(test_score)
+            return TestScore(*self.count_test_score())
         # return a question and countdown line: e.g. "3 of 10"
-        return views.render_test_step(test_step, countdown)  # type: ignore
+        return TestStepPage(test_step, countdown)
 
 
     def get_test_summary_step(self) -> TestSummary:
         # User takes the start test before doing drills.
         # After doing the target number of drills, they can take final test.
-        user_test_step_count = len(TestSummary.objects.filter(
-            person=self.person))
-        final_question_user_count = len(TestSummary.objects.filter(
-            person=self.person, topic="final"))
+        progress = self.get_test_progress()
+        user_test_step_count = progress.user_count()
+        final_question_user_count = progress.user_count("final")
         countdown = self.get_countdown_to_final_test()
         not_answered_test_steps = TestSummary.objects.filter(
-            person=self.person, is_correct=None)
+            person=self.person, is_correct=None).select_related(
+                'test_question')
 
         if not user_test_step_count:
             self.set_test_steps(topic='start')
@@ -246,25 +387,25 @@ class Visitor:
             return None  # type: ignore
         elif final_question_user_count == 0 and countdown <= 0:
             self.set_test_steps(topic='final')
-        return next(iter(not_answered_test_steps), None)  # type: ignore
+        return not_answered_test_steps.first()  # type: ignore
 
 
     def get_test_steps_countdown(self) -> str:
         # find out how many test steps are there in start/final tests
-        not_answered_steps = TestSummary.objects.filter(
-            person=self.person, is_correct=None)
+        progress = self.get_test_progress()
         if self.visitor_did_start_test():
-            steps_to_do = len(TestStep.objects.filter(topic="final"))
+            steps_to_do = progress.question_count("final")
         else:
-            steps_to_do = len(TestStep.objects.filter(topic="start"))
+            steps_to_do = progress.question_count("start")
 
         # we need to get a number user is currently doing, so we add 1
-        sequential_step_number = steps_to_do - len(not_answered_steps) + 1
+        sequential_step_number = \
+            steps_to_do - progress.unanswered_count() + 1
         return f"{sequential_step_number} of {steps_to_do}"
 
 
     def set_test_steps(self, topic: str):
-        test_questions_to_show = TestStep.objects.filter(topic=topic)
+        test_questions_to_show = get_catalog().get_test_step_ids(topic)
 
         if len(test_questions_to_show) == 0:
             raise Exception("Error: There are no test questions to display")
@@ -272,11 +413,16 @@ class Visitor:
         # Test steps are to be taken only once each and their quantity
         # in a test is defined, so all test steps are written into db
         # at once so that user is sure to take all obligatory test steps.
-        for test_question in test_questions_to_show:
-            TestSummary(
-                person=self.person,
-                test_question=test_question,
-                topic=topic).save()
+        # Steps already written by a parallel request are skipped.
+        with transaction.atomic():
+            TestSummary.objects.bulk_create([
+                TestSummary(
+                    person=self.person,
+                    test_question_id=test_question_id,
+                    topic_id=topic)
+                for test_question_id in test_questions_to_show
+            ], ignore_conflicts=True)
+        self._test_progress = None
 
 
     def submit_test_answer(self, test_answer: str = None):
@@ -302,29 +448,34 @@ class Visitor:
             test_summary_step.is_correct = False
         test_summary_step.user_answer = test_answer
         test_summary_step.save()
+        self._test_progress = None
         return self.show_test_step()
 
 
+    @locks_person
     def want_to_drill(self, topic: str):
-        # if topic is new, delete answers saved for previous topic
-        if self.person.challenge_topic != topic:
-            CurrentAnswers.objects.filter(person=self.person).delete()
-            self.person.challenge_topic = topic
-            self.person.save()
-        return redirect(reverse("drill-topic"))
+        # if topic is new, forget challenge saved for previous topic
+        if self.get_drill_state().topic != topic:
+            self._drill_state = DrillState(topic=topic)
+            self.save_drill_state(checkpoint=True)
+        return Redirect("drill-topic")
 
 
     def show_challenge(self):
         challenge = get_current_challenge(self)
         if not challenge:
             return self.get_next_challenge()
-        return views.render_challenge(challenge)
+        return ChallengePage(challenge)
 
 
+    @locks_person
     def get_next_challenge(self):
-        challenge = get_new_challenge(self)
+        # the challenge prepared when the previous one was answered
+        challenge = pop_next_challenge(self)
+        if not challenge:
+            challenge = get_new_challenge(self)
         set_new_challenge(self, challenge)
-        return views.render_challenge(challenge)
+        return ChallengePage(challenge)
 
 
 class Challenge:
@@ -339,78 +490,173 @@ class Challenge:
 
 
 def get_current_challenge(visitor: Visitor) -> Challenge:
-    saved_answers = CurrentAnswers.objects.filter(person=visitor.person)
-    if not saved_answers:
+    state = visitor.get_drill_state()
+    challenge = load_challenge(visitor,
+        state.current_question_id, state.current_answers)
+    if challenge:
+        challenge.disclose_answers = bool(state.disclose_answers)
+    return challenge
+
+
+def load_challenge(visitor: Visitor, question_id: Optional[int],
+        saved_answers: str) -> Challenge:
+    saved_answer_ids = [int(answer_id) for answer_id
+        in saved_answers.split(",") if answer_id]
+    if not question_id or not saved_answer_ids:
         return None  # type: ignore
 
-    challenge = Challenge(visitor)
-    # Don't keep question in DB, infer it from answer
-    any_answer = next(iter(saved_answers))
-    challenge.question = Answer.objects.get(pk=any_answer.answer_id).question
-    challenge.answers = [
-        Answer.objects.get(pk=answer.answer_id) for answer in saved_answers
-    ]
-    challenge.disclose_answers = visitor.person.disclose_answers
+    catalog = get_catalog()
+    question = catalog.get_question(question_id)
+    answers = [catalog.get_answer(pk) for pk in saved_answer_ids]
+    if not question or not all(answers):
+        # Content was reloaded by another process after the catalog
+        # was checked, so fetch answers with their question at once.
+        fetched_answers = Answer.objects.select_related(
+            'question').in_bulk(saved_answer_ids)
+        answers = [fetched_answers.get(pk) for pk in saved_answer_ids]
+        first_answer = answers[0] if all(answers) else None
+        question = first_answer.question if first_answer else None
+    # answers of a question removed by a content reload
+    if not question or not all(answers):
+        return None  # type: ignore
 
+    challenge = Challenge(visitor)
+    challenge.question = question
+    challenge.answers = answers  # type: ignore
     return challenge
 
 
 def get_new_challenge(visitor: Visitor):
+    challenge = choose_challenge(visitor)
+    increment_asked_count(visitor, challenge.question)
+    return challenge
+
+
+def choose_challenge(visitor: Visitor):
     challenge = Challenge(visitor)
-    topic = visitor.person.challenge_topic
-    topic_challenges = ChallengeSummary.objects.filter(
-            person=visitor.person, question__topic=topic)
-
-    # When a new topic is chosen by the user, all questions in this topic
-    # are written into ChallengSummary db table for this user.
-    if len(topic_challenges) == 0:
-        set_topic_challenges(visitor, topic=topic)
-        topic_challenges = ChallengeSummary.objects.filter(
-            person=visitor.person, question__topic=topic)
-
-    # Select the question that was asked less number of times.
-    asked_counts: list[int] = \
-        [challenge.asked_count for challenge in topic_challenges]
-    min_asked_count = min(asked_counts, default=0)
-
-    challenges_to_show = cycle([challenge for challenge in topic_challenges
-        if challenge.asked_count == min_asked_count])
-    challenge.question = next(challenges_to_show).question
-
-    # choose four random answers from the question answer set
-    answers_to_question = list(challenge.question.answer_set.all())
-    answers_on_screen = 4
-    challenge.answers = random.sample(answers_to_question, answers_on_screen)
-
-    # increment the number of times asked for the question
-    record = ChallengeSummary.objects.get(
-        person=visitor.person,
-        question=challenge.question)
-    record.asked_count += 1
-    record.save()
+    # no topic chosen has no questions either
+    topic = visitor.get_drill_state().topic or ""
+    catalog = get_catalog()
+    topic_questions = catalog.get_topic_question_ids(topic)
+
+    if len(topic_questions) == 0:
+        raise Exception("Error: There are no questions to display")
+
+    never_asked = get_never_asked(
+        visitor, topic, catalog.stamp, topic_questions)
+    question_id = get_scheduler().pick_question(
+        visitor.person, topic, topic_questions, never_asked)
+    # picked among the topic questions of the catalog
+    challenge.question = catalog.get_question(question_id)  # type: ignore
+
+    # choose four random answers from the question answer set, all
+    # found by the ids the catalog gave
+    correct_ids, wrong_ids = catalog.get_answer_ids(challenge.question.pk)
+    challenge.answers = [catalog.get_answer(answer_id)  # type: ignore
+        for answer_id in sample_answer_ids(correct_ids, wrong_ids)]
     return challenge
 
 
-def set_new_challenge(visitor: Visitor, challenge: Challenge):
-    # Save 4 answers belonging to the last question shown to user to
-    # retrieve it if user makes a pause. Delete old answers before that.
-    CurrentAnswers.objects.filter(person=visitor.person).delete()
-    for answer in challenge.answers:
-        CurrentAnswers(person=visitor.person, answer=answer).save()
-    visitor.person.disclose_answers = challenge.disclose_answers
-    visitor.person.save()
+def get_never_asked(visitor: Visitor, topic: str, catalog_stamp: str,
+        topic_questions: tuple[int, ...]) -> list[int]:
+    # Read from DB once per topic and content reload, then questions
+    # are removed as they are asked. The drill state is saved by the
+    # caller.
+    state = visitor.get_drill_state()
+    if state.never_asked is None or state.catalog_stamp != catalog_stamp:
+        state.never_asked = find_never_asked(
+            visitor.person, topic, topic_questions)
+        state.catalog_stamp = catalog_stamp
+    return state.never_asked
+
+
+def prepare_next_challenge(visitor: Visitor):
+    # Chosen after the answer is recorded, so that the scheduler
+    # knows it. The drill state is saved by the caller.
+    state = visitor.get_drill_state()
+    if state.next_question_id:
+        return
+    challenge = choose_challenge(visitor)
+    state.next_question_id = challenge.question.pk
+    state.next_answers = ",".join(
+        str(answer.pk) for answer in challenge.answers)
+
+
+def get_prepared_challenge(visitor: Visitor) -> Challenge:
+    # Only reads the challenge "next" is going to show. It is counted
+    # as asked and becomes the current one when it is shown.
+    state = visitor.get_drill_state()
+    return load_challenge(visitor,
+        state.next_question_id, state.next_answers)
+
+
+def pop_next_challenge(visitor: Visitor) -> Challenge:
+    state = visitor.get_drill_state()
+    challenge = load_challenge(visitor,
+        state.next_question_id, state.next_answers)
+    # the stash is cleared by set_new_challenge saving the state
+    state.next_question_id = None
+    state.next_answers = ""
+    if challenge:
+        # the challenge is counted as asked once it is shown
+        increment_asked_count(visitor, challenge.question)
+    return challenge
+
 
+def increment_asked_count(visitor: Visitor, question: Question):
+    # The row is written when the question is asked for the first time,
+    # only increments of existing rows wait in the buffer.
+    if asked_counts.get_buffer() and ChallengeSummary.objects.filter(
+            person=visitor.person, question=question).exists():
+        asked_counts.count_asked(visitor.person.pk, question.pk)
+    else:
+        write_asked_count(visitor, question)
 
-def set_topic_challenges(visitor: Visitor, topic: str):
-    topic_questions = Question.objects.filter(topic=topic)
+    if visitor._challenge_count is not None:
+        visitor._challenge_count += 1
+    never_asked = visitor.get_drill_state().never_asked
+    if never_asked and question.pk in never_asked:
+        never_asked.remove(question.pk)
 
-    if len(topic_questions) == 0:
-        raise Exception("Error: There are no questions to display")
 
-    for question in topic_questions:
-        ChallengeSummary(person=visitor.person, question=question).save()
+def write_asked_count(visitor: Visitor, question: Question):
+    record = ChallengeSummary.objects.filter(
+        person=visitor.person, question=question)
+    if not record.update(asked_count=F('asked_count') + 1):
+        try:
+            with transaction.atomic():
+                ChallengeSummary.objects.create(
+                    person=visitor.person,
+                    question=question,
+                    topic_id=question.topic_id,
+                    asked_count=1)
+        except IntegrityError:
+            # the row was created by a parallel request
+            record.update(asked_count=F('asked_count') + 1)
 
 
+def set_new_challenge(visitor: Visitor, challenge: Challenge):
+    # Save the question and 4 answers shown to user to retrieve them
+    # if user makes a pause, together with the next challenge prepared.
+    # A new challenge has disclose_answers False, which resets the flag
+    # left by an answer to the previous one.
+    state = visitor.get_drill_state()
+    state.current_question_id = challenge.question.pk
+    state.current_answers = ",".join(
+        str(answer.pk) for answer in challenge.answers)
+    state.disclose_answers = challenge.disclose_answers
+    visitor.save_drill_state()
+
+
+def save_answered_challenge(visitor: Visitor):
+    # Saved with the next challenge prepared on every answer, so that
+    # a reload shows the answers disclosed and does not let the person
+    # answer again, which would reach the scheduler twice.
+    visitor.get_drill_state().disclose_answers = True
+    visitor.save_drill_state()
+
+
+@locks_person
 def submit_drill_answer(visitor: Visitor, answer_id: int = None,
         no_correct_answer: bool = None):
     challenge = get_current_challenge(visitor)
@@ -419,32 +665,44 @@ def submit_drill_answer(visitor: Visitor, answer_id: int = None,
         raise AssertionError("Answer submit without challenge")
 
     if no_correct_answer is not None:
+        there_is_correct_answer = any(v.is_correct for v in challenge.answers)
+        record_drill_result(visitor, challenge,
+            is_correct=not there_is_correct_answer)
         challenge.disclose_answers = True
-        if any(v.is_correct for v in challenge.answers):
-            set_new_challenge(visitor, challenge)
-            return views.render_challenge(challenge, is_failure=True)
-        else:
-            return views.render_challenge(challenge, is_failure=False)
+        prepare_next_challenge(visitor)
+        save_answered_challenge(visitor)
+        return ChallengePage(challenge, is_failure=there_is_correct_answer)
 
     else:
         is_specified = lambda v: v.pk == answer_id
         answer = next(filter(is_specified, challenge.answers), None)
         if not answer:
-            return views.render_challenge(challenge,
-                with_error="The submitted answer does not match current \
+            return ChallengePage(challenge, with_error="The submitted answer does not match current \
                     question. Try again on this page with actual answers.")
+        record_drill_result(visitor, challenge, is_correct=answer.is_correct)
         challenge.disclose_answers = True
-        if answer.is_correct:
-            return views.render_challenge(challenge, is_failure = False)
-        else:
-            set_new_challenge(visitor, challenge)
-            return views.render_challenge(challenge, is_failure = True)
+        prepare_next_challenge(visitor)
+        save_answered_challenge(visitor)
+        return ChallengePage(challenge, is_failure=not answer.is_correct)
 
 
+@locks_person
 def give_up_drill(visitor: Visitor):
     challenge = get_current_challenge(visitor)
     if not challenge:
         raise AssertionError("Answer submit without challenge")
 
+    record_drill_result(visitor, challenge, is_correct=False)
     challenge.disclose_answers = True
-    return views.render_challenge(challenge, is_failure = True)
+    prepare_next_challenge(visitor)
+    save_answered_challenge(visitor)
+    return ChallengePage(challenge, is_failure=True)
+
+
+def record_drill_result(visitor: Visitor, challenge: Challenge,
+        is_correct: bool):
+    # only the first answer to a challenge tells what the person knows
+    if challenge.disclose_answers:
+        return
+    get_scheduler().record_answer(
+        visitor.person, challenge.question.pk, is_correct)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 
@@ -29,10 +30,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ['SECRET_KEY']
 
+# Production profile: PRODUCTION=1 turns debug off, caches compiled
+# templates, keeps DB connections open and compresses responses.
+PRODUCTION = os.environ.get('PRODUCTION') == '1'
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DEBUG', '0' if PRODUCTION else '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host
+    in os.environ.get('ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -56,10 +62,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-
-    'threadlocals.middleware.ThreadLocalMiddleware',
 ]
 
+if PRODUCTION:
+    # first, so that it compresses the final response
+    MIDDLEWARE.insert(0, 'django.middleware.gzip.GZipMiddleware')
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -69,7 +77,6 @@ TEMPLATES = [
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
-                'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
@@ -78,19 +85,109 @@ TEMPLATES = [
     },
 ]
 
+if DEBUG:
+    TEMPLATES[0]['OPTIONS']['context_processors'].insert(  # type: ignore
+        0, 'django.template.context_processors.debug')
+
+if PRODUCTION:
+    # templates are read and compiled once per worker
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [  # type: ignore
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
+# DB_ENGINE=postgresql selects PostgreSQL set by DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST and DB_PORT, otherwise db.sqlite3 is used.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+# Seconds a worker keeps its connection open between requests.
+# Connections are shared between workers by a pooler in front of
+# PostgreSQL: with DB_POOLER=pgbouncer (transaction pooling) server-side
+# cursors, which live across transactions, are turned off.
+CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', 60 if PRODUCTION else 0))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'simpledrill'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'DISABLE_SERVER_SIDE_CURSORS':
+                os.environ.get('DB_POOLER') == 'pgbouncer',
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # takes the write lock when a drill step begins
+            'ENGINE': 'backend.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        f"DB_ENGINE must be sqlite or postgresql, not {DB_ENGINE}")
+
+# SQLite: seconds to wait for a lock held by another connection,
+# bytes of the database file read through a memory map and how many
+# times a drill step is run again when it finds the database locked
+
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+SQLITE_LOCK_RETRIES = int(os.environ.get('SQLITE_LOCK_RETRIES', 3))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# CACHE_BACKEND is "locmem" (default), "file", "memcached" or a dotted
+# path to a backend class (e.g. django_redis.cache.RedisCache) with
+# CACHE_LOCATION. Memory of a worker is not shared with other workers,
+# so PRODUCTION needs a shared backend.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
 
-DATABASES = {
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+if CACHE_BACKEND in ('locmem', 'file'):
+    # entries beyond it are culled, the default of 300 is for a demo
+    CACHES['default']['OPTIONS'] = {  # type: ignore
+        'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+    }
+
+if CACHE_BACKEND != 'locmem' and not CACHES['default']['LOCATION']:
+    raise ImproperlyConfigured(
+        f"CACHE_LOCATION must be set for CACHE_BACKEND {CACHE_BACKEND}")
+
+if PRODUCTION and CACHE_BACKEND == 'locmem':
+    # each worker would keep its own drill state of a person
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND locmem is not shared by workers, set another "
+        "backend with PRODUCTION=1")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -129,3 +226,46 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Drill content cache
+# Seconds a worker trusts its in-memory questions and answers before
+# checking whether they were reloaded by another process.
+
+CATALOG_CHECK_SECONDS = float(os.environ.get('CATALOG_CHECK_SECONDS', 1))
+
+# File written by the build_catalog command and shared by workers
+
+CATALOG_SNAPSHOT = os.environ.get(
+    'CATALOG_SNAPSHOT', str(BASE_DIR / 'catalog.bin'))
+
+# Number of rendered question, explanation and answer blocks kept
+# by each worker
+
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 4096))
+
+
+# Drill question scheduling: "least_asked", "sm2" (spaced repetition)
+# or a dotted path to a backend.core.scheduler.Scheduler subclass.
+
+DRILL_SCHEDULER = os.environ.get('DRILL_SCHEDULER', 'least_asked')
+
+# Share of drill questions shown with wrong answers only
+
+NO_CORRECT_ANSWER_RATE = float(os.environ.get('NO_CORRECT_ANSWER_RATE', 0.1))
+
+# Drill state of a person lives in the cache and is written to the
+# person row every this many drill steps, see backend.core.drill_state
+
+DRILL_STATE_CHECKPOINT_STEPS = int(
+    os.environ.get('DRILL_STATE_CHECKPOINT_STEPS', 20))
+
+# Write-behind of drill question asked counts: with ASKED_COUNT_BUFFER=1
+# each worker keeps the increments and writes them in batches after
+# this many increments or seconds, see backend.core.asked_counts
+
+ASKED_COUNT_BUFFER = os.environ.get('ASKED_COUNT_BUFFER') == '1'
+ASKED_COUNT_FLUSH_EVENTS = int(
+    os.environ.get('ASKED_COUNT_FLUSH_EVENTS', 100))
+ASKED_COUNT_FLUSH_SECONDS = float(
+    os.environ.get('ASKED_COUNT_FLUSH_SECONDS', 5))
@@ -0,0 +1,15 @@
+"""SQLite database backend whose transactions can take the write lock
+when they begin, see backend.core.sqlite.write_transaction.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # set for the transaction begun next
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        else:
+            super()._start_transaction_under_autocommit()
@@ -15,12 +15,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from backend.app import views
+from backend.app import api, views
 
 app_name = 'app'
 
 urlpatterns = [
-    path('', views.homepage),
+    path('', views.homepage, name='homepage'),
     path('register_visitor/', views.register_visitor, name='register-visitor'),
     path('view_invites/', views.view_invites, name='view-invites'),
     path('add_invite/', views.add_invite, name='add-invite'),
@@ -31,5 +31,12 @@ urlpatterns = [
     path('drill_topic/', views.drill_topic, name='drill-topic'),
     path('explain_test/', views.explain_test, name='explain-test'),
     path('test/', views.test, name='test'),
+    path('api/challenge/next', api.challenge_next,
+        name='api-challenge-next'),
+    path('api/challenge/prepared', api.challenge_prepared,
+        name='api-challenge-prepared'),
+    path('api/challenge/answer', api.challenge_answer,
+        name='api-challenge-answer'),
+    path('api/test/step', api.test_step, name='api-test-step'),
     path('admin/', admin.site.urls),
 ]